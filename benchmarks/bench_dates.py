@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+
+""" Compare the string based date parsing the readers used to do with
+    halocarbons_loader.assemble_dates on a million row file.
+
+        python benchmarks/bench_dates.py [rows]
+"""
+
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from halocarbons_loader import assemble_dates
+
+
+def hourly_frame(rows):
+    """ Date columns like an in situ hourly file """
+    dates = pd.date_range('1998-01-01', periods=rows, freq='h')
+    return pd.DataFrame({'year': dates.year, 'month': dates.month, 'day': dates.day,
+                         'hour': dates.hour, 'minute': np.zeros(rows, dtype='int64')})
+
+
+def timed(label, func, repeat=3):
+    best = min(_time(func) for _ in range(repeat))
+    print(f'{label:<32} {best:8.3f} s')
+    return best
+
+
+def _time(func):
+    t0 = perf_counter()
+    func()
+    return perf_counter() - t0
+
+
+def main(rows=1_000_000):
+    df = hourly_frame(rows)
+    cols = ['year', 'month', 'day', 'hour', 'minute']
+    print(f'{rows} rows')
+
+    def strings():
+        return pd.to_datetime(df['year'].astype(str) + df['month'].astype(str) + df['day'].astype(str)
+                              + df['hour'].astype(str) + df['minute'].astype(str),
+                              format='%Y%m%d%H%M', errors='coerce')
+
+    def frame():
+        return pd.to_datetime(df[cols])
+
+    def numpy():
+        return assemble_dates(*(df[c] for c in cols))
+
+    t_str = timed('astype(str) + to_datetime', strings)
+    t_frame = timed('to_datetime(df[columns])', frame)
+    t_np = timed('assemble_dates', numpy)
+    print(f'speedup {t_str / t_np:.0f}x over strings, {t_frame / t_np:.0f}x over to_datetime(df[columns])')
+
+    # the string parse is ambiguous for single digit parts so compare with the frame method
+    assert (frame().values == numpy()).all()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,381 @@
+#! /usr/bin/env python
+
+""" Time each stage of loading HATS data against a local synthetic server.
+
+    Synthetic files in the format of every reader (M3 GCMS and PR1 pair
+    files, CATS / RITS hourly, daily and monthly .dat files, Otto / OldGC /
+    fECD monthly and pair files and a Combined file) are written with the
+    layout of the real data tree, from halocarbon_urls.catalog(), and served
+    by a local HTTP server. No network access is needed. The stages timed
+    are download, parse, MSDs.monthly, gapfill (linear, seasonal and
+    harmonic), add_location and the data prep of the ratio figure. Each
+    stage takes the best of a few runs.
+
+        python benchmarks/bench_loads.py [--size small|realistic|large] [--json results.json]
+        python benchmarks/bench_loads.py --compare baseline.json --tolerance 1.3
+
+    The results are saved as JSON (one record per stage with the seconds of
+    every run, rows and bytes). With --compare the stages more than
+    tolerance times slower than in the baseline are listed and the exit
+    status is 1.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import functools
+import subprocess
+import http.server
+from datetime import datetime, timezone
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import halocarbon_urls
+from gapfill import Gap_Methods
+from halocarbons_fetch import Fetcher, Preloaded_Fetcher
+from halocarbons_loader import HATS_Loader, MSDs, insitu, Flasks, Combined
+from halocarbons_figures import HATS_Figures
+
+# years of data ending in 2024, the realistic size is about the length of the real records
+SIZES = {'small': 3, 'realistic': 25, 'large': 100}
+LAST_YEAR = 2024
+# flask samples per site and month
+SAMPLES = 4
+MSD_SITES = ('alt', 'sum', 'brw', 'cgo', 'kum', 'mhd', 'mlo', 'nwr', 'thd', 'smo', 'ush', 'psa', 'spo')
+
+# (program, gas, freqs) of the files benchmarked, one gas per file format
+CASES = [
+    ('msd', 'F11', ('monthly',)),       # M3 GCMS pairs
+    ('msd', 'CF4', ('monthly',)),       # PR1 pairs
+    ('CATS', 'F11', ('hourly', 'daily', 'monthly')),
+    ('RITS', 'F11', ('hourly', 'daily', 'monthly')),
+    ('Otto', 'F11', ('pairs', 'monthly')),
+    ('OldGC', 'F11', ('monthly',)),     # OldGC has monthly files only
+    ('fECD', 'F11', ('pairs', 'monthly')),
+    ('combined', 'F11', ('monthly',)),
+]
+
+
+# synthetic files
+
+def signal(t, rng, base=240.0):
+    """ Mole fractions with a trend, a seasonal cycle and noise at decimal years t. """
+    return base - 0.8 * (t - 2000) + 1.5 * np.sin(2 * np.pi * t) + rng.normal(0, 0.5, len(t))
+
+
+def sample_times(years, per_month, rng):
+    """ Random sample dates, per_month in every month of the years. """
+    months = np.arange(np.datetime64(f'{LAST_YEAR - years + 1}-01'), np.datetime64(f'{LAST_YEAR + 1}-01'))
+    month = np.repeat(months, per_month)
+    day = rng.integers(1, 29, len(month))
+    hour, minute = rng.integers(0, 24, len(month)), rng.integers(0, 60, len(month))
+    dates = pd.DatetimeIndex(month.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+                             + hour.astype('timedelta64[h]') + minute.astype('timedelta64[m]'))
+    return dates.sort_values()
+
+
+def decimal_year(dates):
+    return (dates.year + (dates.dayofyear - 1) / 365.25).to_numpy()
+
+
+def table(df, header_lines, float_format='%.3f'):
+    """ Whitespace separated text with header lines in front. """
+    text = df.to_csv(sep=' ', header=False, index=False, float_format=float_format, na_rep='Nan')
+    return ('\n'.join(header_lines) + '\n' + text).encode()
+
+
+def gcms_pairs(years, rng):
+    frames = []
+    for site in MSD_SITES:
+        d = sample_times(years, SAMPLES, rng)
+        frames.append(pd.DataFrame({'site': site, 'dec': decimal_year(d), 'ymd': d.strftime('%Y%m%d'),
+                                    'hm': d.strftime('%H%M'), 'wd': rng.integers(0, 360, len(d)),
+                                    'ws': rng.uniform(0, 15, len(d)).round(1),
+                                    'mf': signal(decimal_year(d), rng), 'sd': rng.uniform(0.1, 1, len(d))}))
+    return table(pd.concat(frames), ['M3 GCMS flask pair means (synthetic)',
+                                     'site dec_date yyyymmdd hhmmss wind_dir wind_spd mf sd'])
+
+
+def pr1_pairs(years, rng):
+    frames = []
+    for site in MSD_SITES:
+        d = sample_times(years, SAMPLES, rng)
+        frames.append(pd.DataFrame({'site': site.upper(), 'dec': decimal_year(d), 'ymd': d.strftime('%Y%m%d'),
+                                    'hm': d.strftime('%H:%M'), 'wd': rng.integers(0, 360, len(d)),
+                                    'ws': rng.uniform(0, 15, len(d)).round(1),
+                                    'mf': signal(decimal_year(d), rng, 80), 'sd': rng.uniform(0.05, 0.3, len(d)),
+                                    'flag': rng.choice(['-', '-', '-', '>'], len(d)), 'inst': 'PR1'}))
+    return table(pd.concat(frames), ['# PR1 flask pair means (synthetic)', 'title',
+                                     'site dec_date yyyymmdd hhmm wind_dir wind_spd mf sd flag inst'])
+
+
+def insitu_file(freq, years, rng):
+    start = f'{LAST_YEAR - years + 1}-01-01'
+    end = f'{LAST_YEAR}-12-31 23:00'
+    if freq == 'hourly':
+        d = pd.date_range(start, end, freq='h')
+        mf = signal(decimal_year(d), rng)
+        mf[rng.random(len(d)) < 0.05] = np.nan
+        df = pd.DataFrame({'y': d.year, 'm': d.month, 'd': d.day, 'h': d.hour, 'mn': 0,
+                           'mf': mf, 'unc': rng.uniform(0.5, 2, len(d))})
+        return table(df, ['# in situ hourly data (synthetic)', 'title', 'yyyy mm dd hh mn mf unc'])
+    if freq == 'daily':
+        d = pd.date_range(start, end, freq='D')
+        df = pd.DataFrame({'y': d.year, 'm': d.month, 'd': d.day, 'mf': signal(decimal_year(d), rng),
+                           'unc': rng.uniform(0.3, 1, len(d)), 'n': rng.integers(1, 25, len(d))})
+        return table(df, ['# in situ daily means (synthetic)', 'yyyy mm dd mf unc n'])
+    d = pd.date_range(start, end, freq='MS')
+    df = pd.DataFrame({'y': d.year, 'm': d.month, 'mf': signal(decimal_year(d), rng),
+                       'sd': rng.uniform(0.3, 1, len(d)), 'n': rng.integers(100, 700, len(d))})
+    return table(df, ['# in situ monthly means (synthetic)', 'yyyy mm mf sd n'])
+
+
+def flask_file(prog, freq, years, rng):
+    fecd = prog == 'fECD'
+    if freq == 'pairs':
+        d = sample_times(years, SAMPLES, rng)
+        df = pd.DataFrame({'y': d.year, 'm': d.month, 'd': d.day, 'h': d.hour, 'mn': d.minute,
+                           'mf': signal(decimal_year(d), rng), 'sd': rng.uniform(0.1, 1, len(d))})
+        if fecd:
+            df['pid'] = rng.integers(1000, 99999, len(d))
+            df['type'] = 'S'
+            df['inst'] = 'ECD'
+            names = 'yyyy mm dd hh mn mf sd pid type inst'
+        else:
+            df['n'] = 2
+            names = 'yyyy mm dd hh mn mf sd n'
+        return table(df, [f'# {prog} flask pairs (synthetic)', names])
+
+    d = pd.date_range(f'{LAST_YEAR - years + 1}-01-01', f'{LAST_YEAR}-12-01', freq='MS')
+    df = pd.DataFrame({'y': d.year, 'm': d.month, 'mf': signal(decimal_year(d), rng),
+                       'sd': rng.uniform(0.1, 1, len(d)), 'n': rng.integers(1, 8, len(d))})
+    if fecd:
+        df['inst'] = 'ECD'
+    return table(df, [f'# {prog} flask monthly means (synthetic)', 'yyyy mm mf sd n' + (' inst' if fecd else '')])
+
+
+def combined_file(gas, years, rng):
+    d = pd.date_range(f'{LAST_YEAR - years + 1}-01-01', f'{LAST_YEAR}-12-01', freq='MS')
+    t = decimal_year(d)
+    df = pd.DataFrame({'y': d.year, 'm': d.month})
+    for region in ('NH', 'SH', 'Global'):
+        df[f'HATS_{region}_{gas}'] = signal(t, rng)
+        df[f'HATS_{region}_{gas}_sd'] = rng.uniform(0.1, 0.5, len(d))
+    df['Programs'] = 111
+    return table(df, ['# combined data (synthetic)', ' '.join(['yyyy', 'mm'] + list(df.columns[2:]))])
+
+
+def make_tree(root, years, seed=0):
+    """ Write the synthetic files of every case under root, returns
+        {(program, gas, freq): [relative paths]}. """
+    rng = np.random.default_rng(seed)
+    cat = halocarbon_urls.catalog()
+    files = {}
+    for program, gas, freqs in CASES:
+        for freq in freqs:
+            entries = [(key, url) for key, url in cat.entries.items()
+                       if key[0] == gas and key[1] == program and key[3] == freq]
+            rels = []
+            for (_, _, site, _), url in sorted(entries, key=lambda e: str(e[0][2])):
+                rel = url[len(cat.base) + 1:]
+                if program == 'msd':
+                    data = pr1_pairs(years, rng) if 'PR1' in rel else gcms_pairs(years, rng)
+                elif program in ('CATS', 'RITS'):
+                    data = insitu_file(freq, years, rng)
+                elif program == 'combined':
+                    data = combined_file(gas, years, rng)
+                else:
+                    data = flask_file(program, freq, years, rng)
+                path = os.path.join(root, rel)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                rels.append(rel)
+            files[(program, gas, freq)] = rels
+    return files
+
+
+# server
+
+class Quiet_Handler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, don't wait for delayed acks between them
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(root):
+    """ Serve root on a local port, returns the server. """
+    srv = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Quiet_Handler, directory=root))
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+# timing
+
+class Recorder:
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def time(self, stage, func, program=None, gas=None, freq=None, **info):
+        """ Best of repeat runs of func(), returns the last result. """
+        runs = []
+        for _ in range(self.repeat):
+            t0 = perf_counter()
+            out = func()
+            runs.append(perf_counter() - t0)
+        rec = {'stage': stage, 'program': program, 'gas': gas, 'freq': freq,
+               'seconds': min(runs), 'runs': [round(r, 6) for r in runs]}
+        if isinstance(out, pd.DataFrame):
+            rec['rows'] = int(out.shape[0])
+        rec.update(info)
+        self.results.append(rec)
+        label = f'{stage}/{info["method"]}' if 'method' in info else stage
+        print(f'{label:<18} {program or "":<9} {gas or "":<5} {freq or "":<8} {rec["seconds"]:9.4f} s'
+              + (f'  {rec["rows"]:>9} rows' if 'rows' in rec else ''))
+        return out
+
+
+def parse_stage(program, gas, freq, fetcher):
+    """ Parse the downloaded files of a case, as the loader does. """
+    if program == 'msd':
+        return MSDs(verbose=False, fetcher=fetcher).pairs(gas)
+    if program in ('CATS', 'RITS'):
+        return insitu(verbose=False, prog=program, fetcher=fetcher).insitu_loader(gas, freq=freq)
+    if program == 'combined':
+        return Combined(verbose=False, fetcher=fetcher).combo_loader(gas)
+    return Flasks(verbose=False, prog=program, fetcher=fetcher).flask_loader(gas, freq=freq)
+
+
+def run(size='realistic', repeat=3, tree=None):
+    years = SIZES[size]
+    root = tree or tempfile.mkdtemp(prefix='hats_bench_')
+    print(f'Writing the {size} synthetic tree ({years} years) to {root}')
+    t0 = perf_counter()
+    files = make_tree(root, years)
+    print(f'  {sum(len(v) for v in files.values())} files in {perf_counter() - t0:.1f} s')
+
+    srv = serve(root)
+    base = halocarbon_urls.basehttp
+    halocarbon_urls.set_basehttp(f'http://127.0.0.1:{srv.server_port}')
+    rec = Recorder(repeat)
+    frames = {}
+    try:
+        cat = halocarbon_urls.catalog()
+        for (program, gas, freq), rels in files.items():
+            urls = [f'{cat.base}/{rel}' for rel in rels]
+            data = rec.time('download', lambda: Fetcher().get_many(urls), program, gas, freq, files=len(urls),
+                            bytes=sum(os.path.getsize(os.path.join(root, r)) for r in rels))
+            pre = Preloaded_Fetcher(Fetcher(), dict(zip(urls, data)))
+            frames[(program, gas, freq)] = rec.time('parse', lambda: parse_stage(program, gas, freq, pre),
+                                                    program, gas, freq)
+            if program == 'msd':
+                frames[(program, gas, freq)] = rec.time('monthly', lambda: MSDs(verbose=False, fetcher=pre).monthly(gas),
+                                                        program, gas, freq)
+
+        gap = Gap_Methods()
+        for key in [('msd', 'F11', 'monthly'), ('fECD', 'F11', 'monthly')]:
+            df = frames[key]
+            sites = df.index.get_level_values('site').unique()
+            rec.time('gapfill', lambda: HATS_Loader.linear_gapfill(df), *key, method='linear')
+            rec.time('gapfill', lambda: gap.seasonal_sites(df, forecast_periods=12), *key, method='seasonal')
+            rec.time('gapfill', lambda: {s: gap.harmonic(df.loc[s], forecast_periods=12) for s in sites},
+                     *key, method='harmonic')
+
+        hats = HATS_Loader()
+        hats.gml_sites     # read the site table outside of the timing
+        for key in [('msd', 'F11', 'monthly'), ('fECD', 'F11', 'monthly'), ('CATS', 'F11', 'hourly')]:
+            frames[key + ('loc',)] = rec.time('add_location', lambda: hats.add_location(frames[key]), *key)
+        hats.close()
+
+        df0, df1 = frames[('msd', 'F11', 'monthly', 'loc')], frames[('fECD', 'F11', 'monthly', 'loc')]
+        df0.attrs, df1.attrs = {'gas': 'F11', 'program': 'msd'}, {'gas': 'F11', 'program': 'fECD'}
+        figures = HATS_Figures()
+
+        def ratio_prep():
+            return figures.return_ratios(figures.multi_instrument_dataframe([df0, df1]), 'msd', 'fECD')
+        rec.time('figure_prep', ratio_prep, 'msd/fECD', 'F11', 'monthly')
+    finally:
+        srv.shutdown()
+        halocarbon_urls.set_basehttp(base)
+        if tree is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {'meta': meta(size, years, repeat), 'results': rec.results}
+
+
+def meta(size, years, repeat):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'size': size, 'years': years, 'repeat': repeat, 'commit': commit,
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def result_key(r):
+    return (r['stage'], r['program'], r['gas'], r['freq'], r.get('method'))
+
+
+def compare(results, baseline, tolerance):
+    """ Stages more than tolerance times slower than baseline. """
+    old = {result_key(r): r['seconds'] for r in baseline['results']}
+    slower = []
+    for r in results['results']:
+        before = old.get(result_key(r))
+        if before and r['seconds'] > tolerance * before:
+            slower.append((result_key(r), before, r['seconds']))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark HATS data loading against a local synthetic server.')
+    parser.add_argument('--size', choices=tuple(SIZES), default='realistic')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each stage, the best is kept')
+    parser.add_argument('--tree', help='write the synthetic files here and keep them')
+    parser.add_argument('--json', help='results file, default bench_loads_<size>.json')
+    parser.add_argument('--compare', help='baseline results file')
+    parser.add_argument('--tolerance', type=float, default=1.3, help='slowdown over the baseline that fails')
+    args = parser.parse_args(argv)
+    path = os.path.abspath(args.json or f'bench_loads_{args.size}.json')
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    tree = os.path.abspath(args.tree) if args.tree else None
+
+    results = run(args.size, args.repeat, tree)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f'Results saved in {path}')
+
+    if baseline:
+        with open(baseline) as f:
+            old = json.load(f)
+        if old['meta']['size'] != args.size:
+            print(f'The baseline is for size {old["meta"]["size"]}, not {args.size}')
+            return 2
+        slower = compare(results, old, args.tolerance)
+        for key, before, now in slower:
+            print(f'slower: {" ".join(str(k) for k in key if k)} {before:.4f} s -> {now:.4f} s')
+        print('FAILED' if slower else 'OK')
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
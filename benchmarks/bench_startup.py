@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+
+""" Time importing halocarbons_loader and creating a HATS_Loader in a fresh
+    interpreter, and check it stays under a budget. statsmodels, altair,
+    matplotlib and the site table are only loaded when gapfill, plotting or
+    add_location need them, so they must not show up here.
+
+        python benchmarks/bench_startup.py [budget seconds]
+
+    Exits with 1 if the best of the runs is over the budget.
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LAZY = ('statsmodels', 'altair', 'matplotlib', 'scipy')
+
+CHILD = f'''
+import sys, json
+from time import perf_counter
+t0 = perf_counter()
+import halocarbons_loader
+t1 = perf_counter()
+hats = halocarbons_loader.HATS_Loader()
+t2 = perf_counter()
+print(json.dumps({{'import': t1 - t0, 'construct': t2 - t1,
+                  'loaded': [m for m in {LAZY!r} if m in sys.modules],
+                  'site_table': halocarbons_loader.site_table.cache_info().currsize}}))
+'''
+
+
+def run_once():
+    out = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(budget=1.0, repeat=5):
+    runs = [run_once() for _ in range(repeat)]
+    best = min(runs, key=lambda r: r['import'] + r['construct'])
+    total = best['import'] + best['construct']
+    print(f'import {best["import"]:.3f} s, HATS_Loader() {best["construct"]:.4f} s, '
+          f'total {total:.3f} s (best of {repeat}, budget {budget:.2f} s)')
+
+    ok = total <= budget
+    if best['loaded']:
+        print(f'loaded at startup: {", ".join(best["loaded"])}')
+        ok = False
+    if best['site_table']:
+        print('sites.csv was read at startup')
+        ok = False
+    print('OK' if ok else 'FAILED')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(float(a) for a in sys.argv[1:2])))
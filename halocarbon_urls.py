@@ -1,8 +1,162 @@
 #! /usr/bin/env python
 
+import json
+import pathlib
+
 # baseftp = 'ftp://ftp.cmdl.noaa.gov/hats'
 basehttp = 'https://www.esrl.noaa.gov/gmd/aftp/data/hats'
 
+# substitutions or commonly used aliases of gas names, the keys are in all uppercase
+GAS_ALIASES = {'F11B': 'F11', 'COS': 'OCS',
+               'MC': 'CH3CCl3', 'CT': 'CCl4',
+               '1211': 'h1211', '1301': 'h1301', '2402': 'h2402',
+               'CFC11': 'F11', 'CFC12': 'F12', 'CFC113': 'F113',
+               '11': 'F11', '113': 'F113', '114': 'F114', '115': 'F115',
+               '12': 'F12', '13': 'F13',
+               '123': 'HCFC123', '124': 'HCFC124', '133A': 'HCFC133a', '133': 'HCFC133a',
+               '141B': 'HCFC141b', '141': 'HCFC141b', '142B': 'HCFC142b', '142': 'HCFC142b',
+               '22': 'HCFC22', '125': 'HFC125', '134A': 'HFC134a', '134': 'HFC134a',
+               '143A': 'HFC143a', '143': 'HFC143a', '152A': 'HFC152a', '152': 'HFC152a',
+               'PCE': 'C2Cl4'}
+
+_catalog = None
+
+
+def base_url(url):
+    """ Server url without the trailing slash, a local path as a file:// url """
+    if '://' not in url:
+        url = pathlib.Path(url).expanduser().absolute().as_uri()
+    return url.rstrip('/')
+
+
+def set_basehttp(url):
+    """ Point every URL class at a different server, for example a local
+        stand-in or mirror of the HATS data tree. A local directory (a path
+        or file:// url) is read without any network calls. """
+    global basehttp
+    basehttp = base_url(url)
+    Flask_GCECD_URLs.BASE_URL = basehttp
+    global _catalog
+    _catalog = None
+
+
+def catalog():
+    """ The URL_Catalog of the current server, built on first use. """
+    global _catalog
+    if _catalog is None or _catalog.base != basehttp:
+        _catalog = URL_Catalog.build()
+    return _catalog
+
+
+def use_catalog(cat):
+    """ Use a saved catalog (URL_Catalog.from_json) instead of building one,
+        basehttp is set to its server. """
+    global _catalog
+    set_basehttp(cat.base)
+    _catalog = cat
+
+
+def all_urls():
+    """ Every url the classes below can generate: the MSD and combined files,
+        CATS and RITS for each site and frequency and the Otto, fECD and OldGC
+        flask files for each site and frequency. """
+    return catalog().all_urls()
+
+
+class URL_Catalog:
+    """ Every (gas, program, site, freq) the URL classes below know about and
+        its url, built once. program is 'msd', 'combined' or the prog of the
+        insitu_URLs / Flask_GCECD_URLs class ('CATS', 'RITS', 'Otto', 'fECD',
+        'OldGC'), site is None for the single file programs. Availability and
+        Last-Modified of the files can be added (for example from a mirror
+        manifest), they are kept by path relative to the server so they carry
+        over to a mirror of it. The catalog can be saved to and loaded from
+        JSON. """
+
+    def __init__(self, base, entries, status=None):
+        self.base = base
+        self.entries = entries      # {(gas, program, site, freq): url}
+        self.status = status or {}  # {relative path: {'available': bool, 'last_modified': str}}
+        self.gases = sorted({key[0] for key in entries})
+        # casefolded names and aliases to the proper gas name
+        self._names = {g.casefold(): g for g in self.gases}
+        self._names.update({alias.casefold(): g for alias, g in GAS_ALIASES.items()})
+
+    @classmethod
+    def build(cls):
+        """ Catalog of the current basehttp. """
+        entries = {}
+        for gas, url in HATS_MSD_URLs().urls.items():
+            entries[(gas, 'msd', None, 'monthly')] = url
+        for gas, url in Combined_Data_URLs().urls.items():
+            entries[(gas, 'combined', None, 'monthly')] = url
+        for prog in ('CATS', 'RITS'):
+            for site in insitu_URLs.program_sites(prog):
+                for freq in ('monthly', 'daily', 'hourly'):
+                    for gas, url in insitu_URLs.file_urls(prog, site, freq).items():
+                        entries[(gas, prog, site, freq)] = url
+        for prog, sites in Flask_GCECD_URLs.PROGRAM_SITES.items():
+            for site in sites:
+                for freq in Flask_GCECD_URLs.SUFFIX:
+                    for gas, url in Flask_GCECD_URLs.file_urls(prog, site, freq).items():
+                        entries[(gas, prog, site, freq)] = url
+        return cls(basehttp, entries)
+
+    def url(self, gas, program, site=None, freq='monthly'):
+        """ The url or None if there is no such file. """
+        return self.entries.get((gas, program, site, freq))
+
+    def all_urls(self):
+        return sorted(set(self.entries.values()))
+
+    def program_gases(self, program):
+        """ Gases of a program, in catalog order. """
+        return list(dict.fromkeys(gas for gas, prog, _, _ in self.entries if prog == program))
+
+    def program_urls(self, program, site=None, freq='monthly'):
+        """ {gas: url} of a program at one site and frequency. """
+        return {gas: url for (gas, prog, s, f), url in self.entries.items()
+                if prog == program and s == site and f == freq}
+
+    def resolve(self, gas):
+        """ The proper name of a gas or one of its aliases (any case), None
+            if it is not measured. """
+        return self._names.get(gas.casefold())
+
+    def _rel(self, url):
+        return url[len(self.base) + 1:]
+
+    def available(self, url):
+        """ True or False if the availability of the file is known, otherwise None. """
+        return self.status.get(self._rel(url), {}).get('available')
+
+    def last_modified(self, url):
+        return self.status.get(self._rel(url), {}).get('last_modified')
+
+    def update_status(self, manifest):
+        """ Availability and Last-Modified from a halocarbons_mirror manifest. """
+        for rel, entry in manifest.get('files', {}).items():
+            self.status[rel] = {'available': True, 'last_modified': entry.get('last_modified')}
+        for rel in manifest.get('missing', []):
+            self.status[rel] = {'available': False, 'last_modified': None}
+
+    def to_json(self):
+        return json.dumps({
+            'base': self.base,
+            'entries': [[gas, prog, site, freq, self._rel(url)]
+                        for (gas, prog, site, freq), url in self.entries.items()],
+            'status': self.status,
+        })
+
+    @classmethod
+    def from_json(cls, text, base=None):
+        """ Catalog from to_json, with its urls on base if given (for example
+            the catalog of the server used for a mirror of it). """
+        d = json.loads(text)
+        base = base_url(base or d['base'])
+        entries = {(gas, prog, site, freq): f'{base}/{rel}' for gas, prog, site, freq, rel in d['entries']}
+        return cls(base, entries, d['status'])
+
 
 class HATS_MSD_URLs:
 
@@ -99,35 +253,54 @@ class insitu_URLs:
         Both programs made about hourly measurements at 5 stations. CATS also made
         measurements at Summit, Greenland (sum) """
 
+    SITES = ('brw', 'nwr', 'mlo', 'smo', 'spo')
+
     def __init__(self, prog='CATS'):
         self.prog = prog.upper()
+        self.sites = self.program_sites(self.prog)
+        self.gases = catalog().program_gases(self.prog)
 
-        self.sites = ['brw', 'nwr', 'mlo', 'smo', 'spo']
-        if self.prog == 'CATS':
-            self.sites.append('sum')    # additional site for CATS
-
-        self.gases = list(self.urls('mlo').keys())
+    @classmethod
+    def program_sites(cls, prog):
+        sites = list(cls.SITES)
+        if prog.upper() == 'CATS':
+            sites.append('sum')    # additional site for CATS
+        return sites
 
     def urls(self, site, freq='monthly'):
-        """ URLs for the Chromatograph for Atmospheric Species (CATS) program as of 20210201 """
+        """ {gas: url} at one site, from the catalog """
+        return catalog().program_urls(self.prog, site, freq)
+
+    @staticmethod
+    def file_urls(prog, site, freq='monthly'):
+        """ URLs for the Chromatograph for Atmospheric Species (CATS) program as of 20210201,
+            the catalog is built from these """
+        prog = prog.upper()
         u = {}
         suffix = {'hourly': 'All', 'daily': 'Day', 'monthly': 'MM'}
 
         # gases common to both insitu programs
-        u['F11'] = f'{basehttp}/cfcs/cfc11/insituGCs/{self.prog}/{freq}/{site}_F11_{suffix[freq]}.dat'
-        u['F12'] = f'{basehttp}/cfcs/cfc12/insituGCs/{self.prog}/{freq}/{site}_F12_{suffix[freq]}.dat'
-        u['h1211'] = f'{basehttp}/halons/insituGCs/{self.prog}/{freq}/{site}_H1211_{suffix[freq]}.dat'
-        u['N2O'] = f'{basehttp}/n2o/insituGCs/{self.prog}/{freq}/{site}_N2O_{suffix[freq]}.dat'
-        u['CCl4'] = f'{basehttp}/solvents/CCl4/insituGCs/{self.prog}/{freq}/{site}_CCl4_{suffix[freq]}.dat'
-        u['CH3CCl3'] = f'{basehttp}/solvents/CH3CCl3/insituGCs/{self.prog}/{freq}/{site}_MC_{suffix[freq]}.dat'
+        u['F11'] = f'{basehttp}/cfcs/cfc11/insituGCs/{prog}/{freq}/{site}_F11_{suffix[freq]}.dat'
+        u['F12'] = f'{basehttp}/cfcs/cfc12/insituGCs/{prog}/{freq}/{site}_F12_{suffix[freq]}.dat'
+        u['h1211'] = f'{basehttp}/halons/insituGCs/{prog}/{freq}/{site}_H1211_{suffix[freq]}.dat'
+        u['N2O'] = f'{basehttp}/n2o/insituGCs/{prog}/{freq}/{site}_N2O_{suffix[freq]}.dat'
+        u['CCl4'] = f'{basehttp}/solvents/CCl4/insituGCs/{prog}/{freq}/{site}_CCl4_{suffix[freq]}.dat'
+        u['CH3CCl3'] = f'{basehttp}/solvents/CH3CCl3/insituGCs/{prog}/{freq}/{site}_MC_{suffix[freq]}.dat'
 
         # CATS additional gases
-        if self.prog == 'CATS':
-            u['F113'] = f'{basehttp}/cfcs/cfc113/insituGCs/{self.prog}/{freq}/{site}_F113_{suffix[freq]}.dat'
-            u['SF6'] = f'{basehttp}/sf6/insituGCs/{self.prog}/{freq}/{site}_SF6_{suffix[freq]}.dat'
+        if prog == 'CATS':
+            u['F113'] = f'{basehttp}/cfcs/cfc113/insituGCs/{prog}/{freq}/{site}_F113_{suffix[freq]}.dat'
+            u['SF6'] = f'{basehttp}/sf6/insituGCs/{prog}/{freq}/{site}_SF6_{suffix[freq]}.dat'
 
         return u
 
+    def url(self, site, gas, freq='monthly'):
+        """ url of one gas at one site, from the catalog """
+        url = catalog().url(gas, self.prog, site, freq)
+        if url is None:
+            raise KeyError(f'No {freq} {gas} file for {self.prog} at {site}')
+        return url
+
 
 class Combined_Data_URLs:
 
@@ -167,6 +340,9 @@ class Flask_GCECD_URLs:
         'CH3CCl3': ('solvents/CH3CCl3', 'MC'),
     }
 
+    # OldGC only has F11, F12, N2O
+    PROGRAM_GASES = {'OldGC': ('F11', 'F12', 'N2O')}
+
     # Frequency suffix mapping
     SUFFIX = {'pairs': 'All', 'monthly': 'MM'}
 
@@ -180,38 +356,46 @@ class Flask_GCECD_URLs:
             self.prog = 'OldGC'
 
         self.sites = self.PROGRAM_SITES[self.prog]
-        # OldGC only has F11, F12, N2O
-        if self.prog == 'OldGC':
-            self.gases = ['F11', 'F12', 'N2O']
-        else:
-            self.gases = list(self.GAS_PATHS.keys())
+        self.gases = catalog().program_gases(self.prog)
 
     def urls(self, site, freq='monthly'):
-        """Generate URLs for a given site and frequency."""
+        """ {gas: url} at one site, from the catalog """
+        return catalog().program_urls(self.prog, site, freq.lower())
+
+    @classmethod
+    def file_urls(cls, prog, site, freq='monthly'):
+        """Generate URLs for a given site and frequency, the catalog is built from these."""
         # Normalize inputs
-        code_site = site.lower() if self.prog == 'Otto' else site.upper()
+        code_site = site.lower() if prog == 'Otto' else site.upper()
         freq_key = freq.lower()
         # OldGC only supports monthly
-        if self.prog == 'OldGC':
+        if prog == 'OldGC':
             freq_key = 'monthly'
 
-        suffix = self.SUFFIX[freq_key]
+        suffix = cls.SUFFIX[freq_key]
         urls = {}
-        for gas in self.gases:
-            path, override_code = self.GAS_PATHS[gas]
+        for gas in cls.PROGRAM_GASES.get(prog, cls.GAS_PATHS):
+            path, override_code = cls.GAS_PATHS[gas]
             # file extension
-            ext = 'txt' if self.prog == 'fECD' else 'dat'
+            ext = 'txt' if prog == 'fECD' else 'dat'
 
-            if self.prog == 'fECD':
+            if prog == 'fECD':
                 # fECD files use NOAAflaskECD naming convention
                 urls[gas] = (
-                    f"{self.BASE_URL}/{path}/flasks/{self.prog}/{freq_key}/"
+                    f"{cls.BASE_URL}/{path}/flasks/{prog}/{freq_key}/"
                     f"{gas}_{code_site}_NOAAflaskECD_{suffix}.{ext}"
                 )
             else:
                 file_code = override_code or gas
                 urls[gas] = (
-                    f"{self.BASE_URL}/{path}/flasks/{self.prog}/{freq_key}/"
+                    f"{cls.BASE_URL}/{path}/flasks/{prog}/{freq_key}/"
                     f"{code_site}_{file_code}_{suffix}.{ext}"
                 )
         return urls
+
+    def url(self, site, gas, freq='monthly'):
+        """ url of one gas at one site, from the catalog """
+        url = catalog().url(gas, self.prog, site, freq.lower())
+        if url is None:
+            raise KeyError(f'No {freq} {gas} file for {self.prog} at {site}')
+        return url
@@ -0,0 +1,264 @@
+#! /usr/bin/env python
+
+""" Analysis of loaded HATS data across programs.
+
+    program_matrix lines up the data of several measurement programs for one
+    gas in a single (site, date) x program table and program_pairs computes
+    the ratio and difference, with their uncertainties, of every pair of
+    programs on the rows they have in common in one vectorized step.
+    compare_programs does this for every gas of a HATS_Loader.load_many
+    result, for inter-comparison checks of all gases at once.
+
+    global_means computes latitude band, hemispheric and global area weighted
+    means and growth rates of a loader DataFrame (with lat from add_location)
+    for every month, from a (month x site) array.
+
+        dfs = hats.load_many(['F11', 'F12'], programs=['msd', 'cats', 'otto'])
+        pairs = compare_programs(dfs)
+        pair_summary(pairs)
+        means = global_means_many(dfs)
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# latitude band edges in degrees, four bands of equal area
+LAT_BANDS = (-90, -30, 0, 30, 90)
+REGIONS = ('SH', 'NH', 'Global')
+
+
+def program_matrix(dfs):
+    """ (site, date) x program table of mf and sd.
+
+        dfs is a {program: DataFrame} dict or a list of loader DataFrames
+        (the program is taken from df.attrs) or a multi_instrument_dataframe
+        (with a prog column). Returns a DataFrame indexed by (site, date)
+        with (field, program) columns, field is 'mf' or 'sd'. """
+    if isinstance(dfs, pd.DataFrame):
+        # multi_instrument_dataframe, long form with a prog column
+        df = dfs.reset_index().set_index(['site', 'date', 'prog'])
+        df = df.reindex(columns=['mf', 'sd'])
+        return df.unstack('prog').sort_index()
+
+    if not isinstance(dfs, dict):
+        dfs = {df.attrs['program']: df for df in dfs if df is not None and df.shape[0] > 0}
+    frames = {prog: df.reindex(columns=['mf', 'sd']) for prog, df in dfs.items()
+              if df is not None and df.shape[0] > 0}
+    if not frames:
+        return pd.DataFrame(columns=pd.MultiIndex.from_product([['mf', 'sd'], []]))
+
+    # one aligned concat on the union of the (site, date) rows
+    matrix = pd.concat(frames, axis=1, names=['prog', 'field']).sort_index()
+    matrix = matrix.swaplevel(axis=1).sort_index(axis=1, level=0, sort_remaining=False)
+    matrix.index = matrix.index.set_names(['site', 'date'])
+    return matrix
+
+
+def program_pairs(matrix, pairs=None):
+    """ Ratio and difference of every pair of programs in a program_matrix,
+        on the (site, date) rows both programs have.
+
+        pairs is a list of (prog0, prog1), default every pair in column order.
+        The uncertainties are propagated from the sd of each program,
+        assuming independent errors:
+            ratio_sd = |ratio| * sqrt((sd0 / mf0)**2 + (sd1 / mf1)**2)
+            diff_sd = sqrt(sd0**2 + sd1**2)
+
+        Returns a long DataFrame indexed by (site, date) with the columns
+        prog0, prog1, ratio, ratio_sd, diff and diff_sd. """
+    progs = list(matrix['mf'].columns) if len(matrix.columns) else []
+    if pairs is None:
+        pairs = list(itertools.combinations(progs, 2))
+    pairs = [(p0, p1) for p0, p1 in pairs if p0 in progs and p1 in progs]
+    columns = ['prog0', 'prog1', 'ratio', 'ratio_sd', 'diff', 'diff_sd']
+    if not pairs:
+        return pd.DataFrame(columns=columns)
+
+    mf = matrix['mf'][progs].to_numpy(dtype=float)
+    sd = matrix['sd'][progs].to_numpy(dtype=float)
+    i = np.array([progs.index(p0) for p0, _ in pairs])
+    j = np.array([progs.index(p1) for _, p1 in pairs])
+
+    # (rows, pairs) arrays
+    a, b, sa, sb = mf[:, i], mf[:, j], sd[:, i], sd[:, j]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = a / b
+        ratio_sd = np.abs(ratio) * np.sqrt((sa / a) ** 2 + (sb / b) ** 2)
+    diff = a - b
+    diff_sd = np.sqrt(sa ** 2 + sb ** 2)
+
+    # keep the rows where both programs have a value, pair by pair
+    row, k = np.nonzero(np.isfinite(a) & np.isfinite(b) & (b != 0))
+    order = np.lexsort((row, k))
+    row, k = row[order], k[order]
+    names = np.array(pairs, dtype=object)
+    return pd.DataFrame({
+        'prog0': names[k, 0],
+        'prog1': names[k, 1],
+        'ratio': ratio[row, k],
+        'ratio_sd': ratio_sd[row, k],
+        'diff': diff[row, k],
+        'diff_sd': diff_sd[row, k],
+    }, index=matrix.index[row])
+
+
+def compare_programs(results, pairs=None):
+    """ program_pairs for every gas of a load_many result
+        ({(gas, program): DataFrame}). Returns one long DataFrame with a
+        gas column, indexed by (site, date). """
+    by_gas = {}
+    for (gas, program), df in results.items():
+        by_gas.setdefault(gas, {})[program] = df
+
+    frames = []
+    for gas, dfs in by_gas.items():
+        if len(dfs) < 2:
+            continue
+        pr = program_pairs(program_matrix(dfs), pairs)
+        if len(pr):
+            frames.append(pr.assign(gas=gas))
+    if not frames:
+        return pd.DataFrame(columns=['prog0', 'prog1', 'ratio', 'ratio_sd', 'diff', 'diff_sd', 'gas'])
+    return pd.concat(frames)
+
+
+def pair_summary(pairs):
+    """ Mean ratio and difference, their spread and the number of points for
+        each program pair and site (and gas for compare_programs). """
+    keys = [c for c in ('gas', 'prog0', 'prog1') if c in pairs.columns] + ['site']
+    grouped = pairs.reset_index().groupby(keys, observed=True, sort=True)
+    return grouped.agg(ratio=('ratio', 'mean'), ratio_std=('ratio', 'std'),
+                       diff=('diff', 'mean'), diff_std=('diff', 'std'), n=('ratio', 'size'))
+
+
+def band_label(lo, hi):
+    """ '30S-EQ' style name of a latitude band. """
+    def fmt(lat):
+        return 'EQ' if lat == 0 else f'{abs(lat):g}{"S" if lat < 0 else "N"}'
+    return f'{fmt(lo)}-{fmt(hi)}'
+
+
+def monthly_site_array(df, col='mf'):
+    """ Monthly means of col for every site of a loader DataFrame as a
+        (month x site) array, with the mean sd and the mean lat of each site
+        (NaN without a lat column).
+
+        Returns (months, sites, x, sd, lat), months are contiguous
+        datetime64[M] from the first to the last month with data. """
+    site_codes, sites = pd.factorize(df.index.get_level_values(0))
+    month = df.index.get_level_values(1).to_numpy().astype('datetime64[M]')
+    first, last = month.min(), month.max()
+    months = np.arange(first, last + 1)
+    M, S = len(months), len(sites)
+
+    # one flat (month, site) bin per row, hourly or monthly data alike
+    idx = (month - first).astype(np.int64) * S + site_codes
+    x = df[col].to_numpy(dtype=float)
+    ok = np.isfinite(x)
+    n = np.bincount(idx[ok], minlength=M * S).reshape(M, S)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xm = np.bincount(idx[ok], weights=x[ok], minlength=M * S).reshape(M, S) / n
+        if 'sd' in df.columns:
+            sd = df['sd'].to_numpy(dtype=float)
+            ok = ok & np.isfinite(sd)
+            sdm = (np.bincount(idx[ok], weights=sd[ok], minlength=M * S)
+                   / np.bincount(idx[ok], minlength=M * S)).reshape(M, S)
+        else:
+            sdm = np.full((M, S), np.nan)
+
+        if 'lat' in df.columns:
+            lat = df['lat'].to_numpy(dtype=float)
+            ok = np.isfinite(lat)
+            lat = (np.bincount(site_codes[ok], weights=lat[ok], minlength=S)
+                   / np.bincount(site_codes[ok], minlength=S))
+        else:
+            lat = np.full(S, np.nan)
+    return months, sites, xm, sdm, lat
+
+
+def global_means(df, col='mf', bands=LAT_BANDS, complete=True, growth_months=12):
+    """ Latitude band, hemispheric and global means of a loader DataFrame.
+
+        df needs a lat column (HATS_Loader.add_location). Sites are averaged
+        within each latitude band (edges in degrees), the bands are weighted
+        by their area (the difference of the sine of their edges) into the
+        SH, NH and Global means. With complete a region is NaN for a month
+        where one of its bands that has sites has no data; load with
+        gapfill=True so every band has a value each month. Otherwise the
+        weights are renormalized over the bands with data.
+
+        The sd columns propagate the site sd, assuming independent errors.
+        The growth columns are the change over growth_months months
+        (per year with the default 12).
+
+        Returns a DataFrame indexed by month with a column per band, SH, NH,
+        Global, their _sd and _growth columns and n, the number of sites. """
+    if 'lat' not in df.columns:
+        raise ValueError('global_means needs the site latitudes, use addlocation=True or add_location.')
+
+    months, sites, x, sd, lat = monthly_site_array(df, col)
+    edges = np.asarray(bands, dtype=float)
+    B = len(edges) - 1
+
+    # site to band, (site x band) membership
+    band = np.searchsorted(edges, lat, side='right') - 1
+    band[lat == edges[-1]] = B - 1
+    member = (band[:, None] == np.arange(B)) & np.isfinite(lat)[:, None]
+    H = member.astype(float)
+
+    have = np.isfinite(x)
+    band_n = have @ H
+    with np.errstate(divide='ignore', invalid='ignore'):
+        band_mean = np.where(have, x, 0) @ H / band_n
+        band_sd = np.sqrt(np.where(have & np.isfinite(sd), sd, 0) ** 2 @ H) / band_n
+
+    # (band x region) area weights
+    area = np.diff(np.sin(np.radians(edges)))
+    mid = (edges[:-1] + edges[1:]) / 2
+    W = np.stack([area * (mid < 0), area * (mid > 0), area], axis=1)
+
+    bhave = band_n > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wsum = bhave @ W
+        region = np.where(bhave, band_mean, 0) @ W / wsum
+        region_sd = np.sqrt(np.where(bhave, band_sd, 0) ** 2 @ W ** 2) / wsum
+    if complete:
+        # bands of the network missing in a month
+        needed = member.any(axis=0)
+        missing = (~bhave & needed) @ (W > 0)
+        region[missing > 0] = np.nan
+        region_sd[missing > 0] = np.nan
+    region[wsum == 0] = np.nan
+
+    growth = np.full_like(region, np.nan)
+    if growth_months < len(months):
+        growth[growth_months:] = region[growth_months:] - region[:-growth_months]
+
+    labels = [band_label(lo, hi) for lo, hi in zip(bands[:-1], bands[1:])]
+    columns = {label: band_mean[:, b] for b, label in enumerate(labels)}
+    for r, name in enumerate(REGIONS):
+        columns[name] = region[:, r]
+        columns[f'{name}_sd'] = region_sd[:, r]
+    for r, name in enumerate(REGIONS):
+        columns[f'{name}_growth'] = growth[:, r]
+    columns['n'] = have[:, member.any(axis=1)].sum(axis=1)
+
+    out = pd.DataFrame(columns, index=pd.DatetimeIndex(months.astype('datetime64[ns]'), name='date'))
+    out.attrs = dict(df.attrs)
+    return out
+
+
+def global_means_many(results, col='mf', bands=LAT_BANDS, complete=True, growth_months=12):
+    """ global_means for every item of a load_many result
+        ({(gas, program): DataFrame}). Returns one DataFrame with gas and
+        program columns, like load_many with long_form. """
+    frames = []
+    for (gas, program), df in results.items():
+        if df is None or df.shape[0] == 0 or 'lat' not in df.columns:
+            continue
+        frames.append(global_means(df, col, bands, complete, growth_months).assign(gas=gas, program=program))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames)
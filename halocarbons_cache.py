@@ -0,0 +1,544 @@
+#! /usr/bin/env python
+
+""" Local on-disk cache for files downloaded from the NOAA/GML HATS data server.
+
+    Raw file bytes are stored by URL in a cache directory. Cached entries are
+    revalidated with conditional requests (If-None-Match / If-Modified-Since)
+    so an unchanged file costs a 304 response instead of a full transfer.
+
+    The cache is bounded in size with least-recently-used eviction, which also
+    covers the results, rows and models kept in its subdirectories, and can be
+    shared by several processes: every entry is written to a temporary file
+    and atomically renamed into place, and eviction is serialized with a lock
+    file.
+
+    Results_Cache sits on top of the raw file cache and stores the parsed
+    DataFrames returned by HATS_Loader.loader in Parquet files keyed by gas,
+    program, frequency, gapfill and a fingerprint of the source files.
+
+    Files that only grow at the end (the in situ hourly files) can be
+    refreshed with a Range request for just the new bytes, and Rows_Cache
+    keeps their parsed rows so only the new lines are parsed.
+
+    Model_Cache keeps the fitted seasonal gapfill models so an unchanged
+    site is not refitted and one with new months starts from its old fit.
+"""
+
+import io
+import os
+import re
+import json
+import hashlib
+import tempfile
+import contextlib
+from time import time
+from email.utils import formatdate
+import urllib.request
+import urllib.error
+
+try:
+    import fcntl
+except ImportError:     # Windows, eviction is not locked between processes
+    fcntl = None
+
+APPEND_OVERLAP = 1024   # cached bytes re-downloaded to check a file was only appended to
+HEAD_BYTES = 4096       # leading bytes compared to check the file header did not change
+CACHED_FILES = ('.cache', '.parquet', '.json')  # counted toward max_bytes and evicted
+
+
+def default_cache_dir():
+    """ Cache location, override with the HATS_CACHE_DIR environment variable. """
+    return os.environ.get('HATS_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'hats'))
+
+
+def have_pyarrow():
+    try:
+        import pyarrow     # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def touch(path):
+    """ Mark a cached file as used for the LRU eviction. """
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(path)
+
+
+def header(headers, name):
+    """ Case insensitive lookup in a dict of response headers """
+    name = name.lower()
+    return next((v for k, v in headers.items() if k.lower() == name), None)
+
+
+def fingerprint(metas):
+    """ Hash of the content of a set of cached files, metas are the entries
+        returned by HTTP_Cache.meta """
+    h = hashlib.sha256()
+    for meta in sorted(metas, key=lambda m: m['url']):
+        h.update(meta['url'].encode())
+        # entries written before content hashes were stored fall back to the validators
+        h.update((meta.get('sha256') or f"{meta.get('etag')}{meta.get('last_modified')}").encode())
+    return h.hexdigest()
+
+
+class HTTP_Cache:
+    """ Each url is stored as a single file named by the sha256 of the url. The
+        file starts with one line of JSON (url, ETag, Last-Modified, size)
+        followed by the raw bytes. The file mtime is the time the entry was
+        last validated against the server and atime is the time it was last
+        used, which drives the LRU eviction. The Results_Cache, Rows_Cache and
+        Model_Cache files in subdirectories of the cache directory count
+        toward max_bytes and are evicted with the downloaded files. """
+
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024**3, max_age=60, timeout=60, pool=None, verbose=False):
+        """ cache_dir : directory for the cache, created if needed
+            max_bytes : total size of cached files (subdirectories included)
+                        before LRU eviction
+            max_age   : seconds an entry is used without revalidating it
+            timeout   : network timeout in seconds
+            pool      : halocarbons_fetch.Connection_Pool for keep-alive requests """
+        self.pool = pool
+        self.cache_dir = os.path.expanduser(cache_dir or default_cache_dir())
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.timeout = timeout
+        self.verbose = verbose
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.hits = 0           # served without contacting the server
+        self.revalidated = 0    # 304 Not Modified responses
+        self.downloads = 0      # full transfers
+        self.appended = 0       # only the new end of the file transferred
+
+    def _path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.cache')
+
+    def _read_entry(self, path, read_body=True):
+        """ Returns (meta, body, mtime) or (None, None, None) if there is no
+            usable entry. body is None when read_body is False. """
+        try:
+            with open(path, 'rb') as f:
+                mtime = os.fstat(f.fileno()).st_mtime
+                meta = json.loads(f.readline())
+                body = f.read() if read_body else None
+        except (FileNotFoundError, ValueError):
+            return None, None, None
+        if read_body and len(body) != meta.get('size'):
+            return None, None, None
+        return meta, body, mtime
+
+    def _read_meta(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return json.loads(f.readline())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_entry(self, path, meta, body):
+        """ Write to a temporary file in the cache directory then rename it,
+            so readers in other processes never see a partial entry. """
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(meta).encode() + b'\n')
+                f.write(body)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+            raise
+
+    def _touch(self, path, validated=False):
+        """ atime is last use, mtime is last validation. """
+        now = time()
+        with contextlib.suppress(FileNotFoundError):
+            mtime = now if validated else os.stat(path).st_mtime
+            os.utime(path, (now, mtime))
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with open(os.path.join(self.cache_dir, '.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _request(self, url, headers):
+        """ Returns (status, response headers, body). A 304 has an empty body. """
+        if self.pool is not None:
+            return self.pool.request(url, headers)
+        req = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                return r.status, dict(r.headers), r.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return 304, dict(e.headers), b''
+            raise
+
+    def get(self, url, append=False):
+        """ Returns the contents of url as bytes, from the cache when the
+            server reports the cached copy is still current. Set append for
+            files that only grow at the end, only the new bytes are then
+            downloaded when the file changed. """
+        return self._refresh(url, append=append)[1]
+
+    def _request_tail(self, url, headers, body):
+        """ Conditional Range request for the bytes after the cached body,
+            starting APPEND_OVERLAP bytes early. Returns (status, headers, body)
+            like _request, where a 206 body is the cached and new bytes joined.
+            Returns None if the file was not simply appended to. """
+        start = len(body) - APPEND_OVERLAP
+        try:
+            status, rheaders, part = self._request(url, {**headers, 'Range': f'bytes={start}-'})
+        except urllib.error.HTTPError as e:
+            if e.code == 416:   # file is now shorter than the cached copy
+                return None
+            raise
+        if status != 206:
+            # 304, or a server that ignores Range sends the whole file
+            return status, rheaders, part
+
+        m = re.match(r'bytes (\d+)-(\d+)/(\d+)', header(rheaders, 'Content-Range') or '')
+        if (m is None or int(m[1]) != start or int(m[3]) != start + len(part)
+                or part[:APPEND_OVERLAP] != body[start:]):
+            return None
+
+        # the overlap matched, make sure the header did not change either
+        n = min(HEAD_BYTES, start)
+        _, _, head = self._request(url, {'Range': f'bytes=0-{n - 1}'})
+        if head[:n] != body[:n]:
+            return None
+        return 206, rheaders, body[:start] + part
+
+    def _refresh(self, url, read_body=True, append=False):
+        """ Make sure the cached copy of url is current. Returns (meta, body),
+            body is only read from disk if read_body is True. """
+        path = self._path(url)
+        meta, body, mtime = self._read_entry(path, read_body or append)
+
+        if meta is not None and time() - mtime < self.max_age:
+            self.hits += 1
+            self._touch(path)
+            return meta, body
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            if append and meta is not None and len(body) > APPEND_OVERLAP:
+                # the file was not simply appended to, download all of it
+                status, rheaders, new_body = self._request_tail(url, headers, body) or self._request(url, {})
+            else:
+                status, rheaders, new_body = self._request(url, headers)
+        except (urllib.error.URLError, OSError) as e:
+            if meta is None:
+                raise
+            # server unreachable, a stale copy is better than nothing
+            print(f'Could not revalidate {url} ({e}), using cached copy.')
+            self._touch(path)
+            return meta, body
+
+        if status == 304 and meta is not None:
+            self.revalidated += 1
+            self._touch(path, validated=True)
+            if self.verbose:
+                print(f'Not modified: {url}')
+            return meta, body
+
+        if status == 206:
+            self.appended += 1
+        else:
+            self.downloads += 1
+        meta = {
+            'url': url,
+            'etag': header(rheaders, 'ETag'),
+            'last_modified': header(rheaders, 'Last-Modified') or formatdate(usegmt=True),
+            'sha256': hashlib.sha256(new_body).hexdigest(),
+            'size': len(new_body),
+        }
+        self._write_entry(path, meta, new_body)
+        self.evict()
+        return meta, new_body
+
+    def meta(self, url, append=False):
+        """ Metadata of the current version of url (revalidated if needed)
+            without reading the cached file. """
+        return self._refresh(url, read_body=False, append=append)[0]
+
+    def fingerprint(self, urls):
+        """ A hash of the current content of every url. The urls are revalidated
+            (downloaded only if they changed) but not read from disk. """
+        return fingerprint([self.meta(url) for url in urls])
+
+    def validator(self, url):
+        """ The ETag or Last-Modified of the cached copy of url, None if the url
+            is not cached. """
+        meta = self._read_meta(self._path(url))
+        if meta is None:
+            return None
+        return meta.get('etag') or meta.get('last_modified')
+
+    def _entries(self):
+        """ (atime, size, path) of every cached file, in the cache directory
+            and its subdirectories. Lock and temporary files are skipped. """
+        entries = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(CACHED_FILES):
+                    continue
+                path = os.path.join(root, name)
+                with contextlib.suppress(FileNotFoundError):
+                    st = os.stat(path)
+                    entries.append((st.st_atime, st.st_size, path))
+        return entries
+
+    def size(self):
+        """ Total bytes held in the cache, subdirectories included. """
+        return sum(e[1] for e in self._entries())
+
+    def evict(self):
+        """ Remove least recently used files, downloaded or stored in a
+            subdirectory, until the cache is under max_bytes. """
+        with self._lock():
+            entries = self._entries()
+            total = sum(e[1] for e in entries)
+            for atime, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                total -= size
+
+    def clear(self):
+        """ Remove every cached file. """
+        with self._lock():
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(('.cache', '.tmp')):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(entry.path)
+
+
+class Results_Cache:
+    """ Parsed DataFrames stored as Parquet files. The file name holds the gas,
+        program, freq and gapfill method plus a fingerprint of the source files
+        (see HTTP_Cache.fingerprint), so a changed source file gives a new key
+        and a stale result is never returned. Parquet needs pyarrow, without it
+        the results cache is disabled. """
+
+    def __init__(self, cache_dir=None, verbose=False):
+        self.cache_dir = os.path.expanduser(cache_dir or os.path.join(default_cache_dir(), 'results'))
+        self.verbose = verbose
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.enabled = have_pyarrow()
+        if not self.enabled:
+            print('pyarrow is not installed, loaded data will not be cached.')
+
+    def _prefix(self, gas, program, freq, gapfill, subset=''):
+        # subset is a key for a selection of sites and dates, '' for all the data
+        subset = f'sub-{subset}_' if subset else ''
+        # gapfill is False, True or the name of the gapfill method
+        gf = f'gf-{gapfill}' if isinstance(gapfill, str) else 'gf' if gapfill else 'raw'
+        return f'{gas}_{program}_{freq}_{subset}{gf}_'
+
+    def _path(self, gas, program, freq, gapfill, fingerprint, subset=''):
+        return os.path.join(self.cache_dir,
+            f'{self._prefix(gas, program, freq, gapfill, subset)}{fingerprint[:32]}.parquet')
+
+    def get(self, gas, program, freq, gapfill, fingerprint, subset=''):
+        """ Returns the cached DataFrame or None. """
+        if not self.enabled:
+            return None
+        import pandas as pd
+        path = self._path(gas, program, freq, gapfill, fingerprint, subset)
+        try:
+            df = pd.read_parquet(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        touch(path)
+        if self.verbose:
+            print(f'Loaded from cache: {path}')
+        return df
+
+    def has(self, gas, program, freq, gapfill, fingerprint, subset=''):
+        """ True if a result is stored for the key, without reading it. """
+        return self.enabled and os.path.exists(self._path(gas, program, freq, gapfill, fingerprint, subset))
+
+    def put(self, df, gas, program, freq, gapfill, fingerprint, subset=''):
+        """ Store df and remove results for the same key built from older
+            versions of the source files. """
+        if not self.enabled or df.shape[0] == 0:
+            return
+        path = self._path(gas, program, freq, gapfill, fingerprint, subset)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            df.to_parquet(tmp)
+            os.replace(tmp, path)
+        except (ValueError, TypeError, NotImplementedError) as e:
+            print(f'Could not cache {gas} {program} {freq}: {e}')
+            return
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+
+        prefix = self._prefix(gas, program, freq, gapfill, subset)
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(prefix) and entry.path != path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entry.path)
+
+    def clear(self):
+        """ Remove every cached result. """
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(('.parquet', '.tmp')):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entry.path)
+
+
+class Rows_Cache:
+    """ Parsed rows of files that only grow at the end (the in situ hourly
+        files). For each url the rows parsed so far are kept in a Parquet file
+        next to a JSON file with the number of bytes they were parsed from and
+        the sha256 of those bytes. When the new contents start with the same
+        bytes only the lines after them are parsed. Needs pyarrow, without it
+        every file is parsed in full. """
+
+    def __init__(self, cache_dir=None, verbose=False):
+        self.cache_dir = os.path.expanduser(cache_dir or os.path.join(default_cache_dir(), 'rows'))
+        self.verbose = verbose
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.enabled = have_pyarrow()
+        self.appended = 0       # parsed only the new lines
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return (os.path.join(self.cache_dir, f'{key}.parquet'),
+                os.path.join(self.cache_dir, f'{key}.json'))
+
+    def _stored(self, url, data, end):
+        """ The stored rows if they were parsed from the start of data, and
+            the offset they end at. """
+        rows_path, state_path = self._paths(url)
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None, 0
+        offset = state['offset']
+        if offset > end or hashlib.sha256(data[:offset]).hexdigest() != state['sha256']:
+            return None, 0
+
+        import pandas as pd
+        try:
+            df = pd.read_parquet(rows_path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None, 0
+        touch(rows_path)
+        touch(state_path)
+        return df, offset
+
+    def _store(self, url, df, data, end):
+        rows_path, state_path = self._paths(url)
+        # remove the state first so a failed write never pairs new rows with an old offset
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(state_path)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            df.to_parquet(tmp)
+            os.replace(tmp, rows_path)
+            with open(tmp, 'w') as f:
+                json.dump({'url': url, 'offset': end, 'sha256': hashlib.sha256(data[:end]).hexdigest()}, f)
+            os.replace(tmp, state_path)
+        except (ValueError, TypeError, NotImplementedError) as e:
+            print(f'Could not cache rows of {url}: {e}')
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+
+    def get(self, url, data, parse):
+        """ Parsed contents of url. data is the whole file, parse(buf) parses
+            a file and parse(buf, header=None) a run of data lines. """
+        import pandas as pd
+
+        # only complete lines are stored, the file may be mid write
+        end = data.rfind(b'\n') + 1
+
+        df, offset = self._stored(url, data, end) if self.enabled else (None, 0)
+        if df is None:
+            df = parse(io.BytesIO(data[:end]))
+        elif end > offset:
+            self.appended += 1
+            if self.verbose:
+                print(f'Parsing {end - offset} new bytes of {url}')
+            df = pd.concat([df, parse(io.BytesIO(data[offset:end]), header=None)])
+
+        if self.enabled and end != offset:
+            self._store(url, df, data, end)
+
+        if data[end:].strip():
+            df = pd.concat([df, parse(io.BytesIO(data[end:]), header=None)])
+        return df
+
+    def clear(self):
+        """ Remove every stored file. """
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(('.parquet', '.json', '.tmp')):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entry.path)
+
+
+class Model_Cache:
+    """ Fitted Holt-Winters gapfill models (see Gap_Methods.seasonal_sites),
+        one JSON file per gas and program holding a model for each site: the
+        smoothing parameters, initial states and a sha256 of the training
+        series they were fitted to. """
+
+    def __init__(self, cache_dir=None, verbose=False):
+        self.cache_dir = os.path.expanduser(cache_dir or os.path.join(default_cache_dir(), 'models'))
+        self.verbose = verbose
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, gas, program):
+        return os.path.join(self.cache_dir, f'{gas}_{program}.json')
+
+    def get(self, gas, program):
+        """ {site: model} dict, empty if nothing is stored. """
+        path = self._path(gas, program)
+        try:
+            with open(path) as f:
+                models = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        touch(path)
+        return models
+
+    def put(self, models, gas, program):
+        """ Store the {site: model} dict. """
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(models, f)
+            os.replace(tmp, self._path(gas, program))
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+        if self.verbose:
+            print(f'Stored {len(models)} gapfill models for {gas} {program}')
+
+    def clear(self):
+        """ Remove every stored model. """
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(('.json', '.tmp')):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entry.path)
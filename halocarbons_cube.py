@@ -0,0 +1,189 @@
+#! /usr/bin/env python
+
+""" Monthly HATS data of many gases in one gas x site x month cube.
+
+    HATS_Cube.build lays out monthly loader results (a load_many dict) in
+    dense NumPy arrays, one layer each for mf, sd and a mask of the measured
+    months, and stores them as .npy files in a directory with the gas, site
+    and month labels in cube.json. Opening a cube memory-maps the layers, so
+    several analysis processes read the same pages from the OS cache instead
+    of each holding a copy.
+
+        cube = HATS_Cube.from_loader(hats, '/data/hats_cube', gapfill=True)
+        cube = HATS_Cube('/data/hats_cube')
+        cube.sel('mf', gas=['F11', 'F12'], site='brw', start='2010')
+        cube.to_frame('SF6')
+"""
+
+import os
+import json
+import tempfile
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+from halocarbons_analysis import monthly_site_array
+
+LAYERS = ('mf', 'sd', 'mask')
+LABELS = 'cube.json'
+
+
+class HATS_Cube:
+
+    def __init__(self, path, mode='r'):
+        """ Open the cube stored in the directory path. mode is the np.load
+            mmap_mode, 'r' (read only, shared) or 'r+' to update it in place. """
+        self.path = os.path.expanduser(path)
+        with open(os.path.join(self.path, LABELS)) as f:
+            labels = json.load(f)
+        self.gases = labels['gases']
+        self.sites = labels['sites']
+        self.programs = labels['programs']
+        self.lat = np.array(labels['lat'], dtype=float)
+        first = np.datetime64(labels['first'], 'M')
+        self.months = np.arange(first, first + labels['months'])
+        self.gas_index = {g: i for i, g in enumerate(self.gases)}
+        self.site_index = {s: i for i, s in enumerate(self.sites)}
+        self.layers = {layer: np.load(os.path.join(self.path, f'{layer}.npy'), mmap_mode=mode) for layer in LAYERS}
+
+    def __repr__(self):
+        return (f'HATS_Cube({self.path!r}, {len(self.gases)} gases x {len(self.sites)} sites x '
+                f'{len(self.months)} months {self.months[0]} to {self.months[-1]})')
+
+    @property
+    def dates(self):
+        """ First day of each month as a DatetimeIndex. """
+        return pd.DatetimeIndex(self.months.astype('datetime64[ns]'), name='date')
+
+    @classmethod
+    def build(cls, results, path, dtype='float64'):
+        """ Store monthly loader results in a cube at path and open it.
+
+            results is a {gas: DataFrame} dict or a load_many result
+            ({(gas, program): DataFrame}) with one program per gas. Sites are
+            the union of the sites of all gases and months run from the first
+            to the last month of any gas. mf and sd are the monthly means
+            (hourly or daily results are averaged), mask is True where mf was
+            measured rather than gapfilled. Each layer is written to disk one
+            gas at a time and renamed into place. """
+        items = {}
+        for key, df in results.items():
+            if df is None or df.shape[0] == 0:
+                continue
+            gas, program = key if isinstance(key, tuple) else (key, df.attrs.get('program', ''))
+            if gas in items:
+                raise ValueError(f'{gas} is in the results from more than one program, build a cube per program.')
+            items[gas] = (program, df)
+        if not items:
+            raise ValueError('No data to build a cube from.')
+
+        # labels: union of sites and months over all gases
+        gases = list(items)
+        sites = sorted(set().union(*(df.index.get_level_values(0).unique() for _, df in items.values())))
+        dates = [df.index.get_level_values(1) for _, df in items.values()]
+        first = min(d.min() for d in dates).to_datetime64().astype('datetime64[M]')
+        last = max(d.max() for d in dates).to_datetime64().astype('datetime64[M]')
+        G, S, M = len(gases), len(sites), int((last - first).astype(int)) + 1
+        site_index = pd.Index(sites)
+
+        path = os.path.expanduser(path)
+        os.makedirs(path, exist_ok=True)
+        tmps = {}
+        try:
+            arrays = {}
+            for layer in LAYERS:
+                fd, tmps[layer] = tempfile.mkstemp(dir=path, suffix='.tmp')
+                os.close(fd)
+                arrays[layer] = np.lib.format.open_memmap(
+                    tmps[layer], mode='w+', dtype=bool if layer == 'mask' else dtype, shape=(G, S, M))
+
+            lat = np.full(S, np.nan)
+            for g, gas in enumerate(gases):
+                _, df = items[gas]
+                months, gsites, mf, sd, glat = monthly_site_array(df, 'mf')
+                measured = monthly_site_array(df, 'mf_raw')[2] if 'mf_raw' in df.columns else mf
+                si = site_index.get_indexer(gsites)
+                m0 = int((months[0] - first).astype(int))
+                window = slice(m0, m0 + len(months))
+
+                for layer, values, fill in (('mf', mf, np.nan), ('sd', sd, np.nan), ('mask', np.isfinite(measured), False)):
+                    block = np.full((S, M), fill, dtype=arrays[layer].dtype)
+                    block[si, window] = values.T
+                    arrays[layer][g] = block
+                lat[si] = np.where(np.isnan(lat[si]), glat, lat[si])
+
+            for layer in LAYERS:
+                arrays[layer].flush()
+                del arrays[layer]
+                os.replace(tmps[layer], os.path.join(path, f'{layer}.npy'))
+
+            labels = {'gases': gases, 'sites': sites, 'programs': [items[g][0] for g in gases],
+                      'lat': [None if np.isnan(x) else float(x) for x in lat],
+                      'first': str(first), 'months': M}
+            fd, tmps['labels'] = tempfile.mkstemp(dir=path, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(labels, f)
+            os.replace(tmps['labels'], os.path.join(path, LABELS))
+        finally:
+            for tmp in tmps.values():
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp)
+        return cls(path)
+
+    @classmethod
+    def from_loader(cls, hats, path, gases=None, program='msd', gapfill=False, **kwargs):
+        """ Load the monthly data of gases (default all) from one program
+            with hats.load_many and build a cube from it. """
+        results = hats.load_many(gases, programs=program, freq='monthly', gapfill=gapfill,
+                                 addlocation=True, **kwargs)
+        return cls.build(results, path)
+
+    def index(self, gas=None, site=None, start=None, end=None):
+        """ Positions of the labels along each axis. A single gas or site
+            gives an int (the axis is dropped), a list gives a list and None
+            a full slice. start and end (inclusive) give a month slice. """
+        def positions(labels, index, name):
+            if labels is None:
+                return slice(None)
+            if isinstance(labels, str):
+                if labels not in index:
+                    raise KeyError(f'{labels} is not a {name} in the cube')
+                return index[labels]
+            missing = [x for x in labels if x not in index]
+            if missing:
+                raise KeyError(f'{", ".join(missing)} not {name}s in the cube')
+            return [index[x] for x in labels]
+
+        lo = 0 if start is None else np.searchsorted(self.months, np.datetime64(pd.Timestamp(start), 'M'))
+        hi = len(self.months) if end is None else np.searchsorted(self.months, np.datetime64(pd.Timestamp(end), 'M'), side='right')
+        return positions(gas, self.gas_index, 'gas'), positions(site, self.site_index, 'site'), slice(lo, hi)
+
+    def sel(self, layer='mf', gas=None, site=None, start=None, end=None):
+        """ Array of a layer for the labels. Single labels and ranges are
+            views of the memory-mapped file, lists of labels are copies. """
+        g, s, m = self.index(gas, site, start, end)
+        arr = self.layers[layer]
+        if isinstance(g, list) and isinstance(s, list):
+            return arr[np.ix_(g, s, np.arange(len(self.months))[m])]
+        return arr[g][:, s, m] if isinstance(g, list) else arr[g, s, m]
+
+    def to_frame(self, gas, site=None, start=None, end=None, dropna=True):
+        """ One gas as a loader style DataFrame indexed by (site, date) with
+            mf, sd, measured and lat columns. """
+        g, s, m = self.index(gas, site, start, end)
+        sites = np.array(self.sites)[s] if not isinstance(s, int) else np.array([self.sites[s]])
+        shape = (len(sites), -1)
+        mf = np.asarray(self.layers['mf'][g, s, m]).reshape(shape)
+        sd = np.asarray(self.layers['sd'][g, s, m]).reshape(shape)
+        mask = np.asarray(self.layers['mask'][g, s, m]).reshape(shape)
+        dates = self.dates[m]
+        lat = self.lat[s] if not isinstance(s, int) else self.lat[[s]]
+
+        df = pd.DataFrame({'mf': mf.ravel(), 'sd': sd.ravel(), 'measured': mask.ravel(),
+                           'lat': np.repeat(lat, len(dates))},
+                          index=pd.MultiIndex.from_product([sites, dates], names=['site', 'date']))
+        if dropna:
+            df = df[np.isfinite(df['mf'].to_numpy())]
+        df.attrs = {'gas': gas, 'program': self.programs[g]}
+        return df
@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+
+""" CPU parallelism for the loaders and gapfill, configured in one place.
+
+    An Executor runs tasks serially, on a pool of threads or on a pool of
+    processes. HATS_Loader takes one (with the number of workers and the
+    multiprocessing start method) and hands it to the program classes that
+    parse the site files, so CPU work is bounded by a single setting. Downloads are
+    limited separately by the Fetcher concurrency (io_concurrency in
+    HATS_Loader).
+
+        executor = Executor('process', workers=4, start_method='spawn')
+        hats = HATS_Loader(io_concurrency=8, executor=executor)
+"""
+
+import os
+import threading
+import concurrent.futures
+
+KINDS = ('serial', 'thread', 'process')
+
+
+class Executor:
+
+    def __init__(self, kind='process', workers=None, start_method=None):
+        """ kind         : 'serial', 'thread' or 'process'
+            workers      : pool size, default the number of cpus
+            start_method : multiprocessing start method ('fork', 'spawn' or
+                           'forkserver') for the process pool, default the
+                           platform default
+
+            The pools are started on first use and kept until close(). """
+        if kind not in KINDS:
+            raise ValueError(f'Unknown executor kind: {kind}, choose from {KINDS}')
+        self.kind = kind
+        self.workers = 1 if kind == 'serial' else (workers or os.cpu_count() or 1)
+        self.start_method = start_method
+        self._processes = None
+        self._threads = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'Executor({self.kind!r}, workers={self.workers}, start_method={self.start_method!r})'
+
+    def __getstate__(self):
+        # the pools stay with the process that started them
+        state = self.__dict__.copy()
+        state.update(_processes=None, _threads=None, _lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _process_pool(self):
+        with self._lock:
+            if self._processes is None:
+                import multiprocessing as mp
+                self._processes = mp.get_context(self.start_method).Pool(self.workers)
+            return self._processes
+
+    def _thread_pool(self):
+        with self._lock:
+            if self._threads is None:
+                self._threads = concurrent.futures.ThreadPoolExecutor(self.workers)
+            return self._threads
+
+    def map(self, func, items, threads=False):
+        """ [func(item) for item in items] on the executor. With threads a
+            process executor runs the tasks on threads instead, for functions
+            that can't be pickled or that mostly wait. """
+        items = list(items)
+        if self.kind == 'serial' or len(items) < 2:
+            return [func(item) for item in items]
+        if self.kind == 'process' and not threads:
+            return self._process_pool().map(func, items)
+        return list(self._thread_pool().map(func, items))
+
+    def starmap(self, func, items, threads=False):
+        """ [func(*args) for args in items] on the executor. """
+        items = list(items)
+        if self.kind == 'serial' or len(items) < 2:
+            return [func(*args) for args in items]
+        if self.kind == 'process' and not threads:
+            return self._process_pool().starmap(func, items)
+        return list(self._thread_pool().map(lambda args: func(*args), items))
+
+    def close(self):
+        """ Stop the pools, they are started again if the executor is used. """
+        with self._lock:
+            if self._processes is not None:
+                self._processes.terminate()
+                self._processes.join()
+                self._processes = None
+            if self._threads is not None:
+                self._threads.shutdown()
+                self._threads = None
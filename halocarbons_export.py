@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+
+""" Batch export of HATS data to files, for cron jobs and workflow managers.
+
+    Every (gas, program, freq) is a job: it is loaded (and gapfilled) with a
+    HATS_Loader and written to one Parquet, CSV or netCDF file in the output
+    directory. Jobs run in parallel on a process Executor, each worker keeps
+    its own loader and they share the cache directory. A job that fails does
+    not stop the others. The time, rows and error of every job are printed
+    at the end and saved in export_summary.json, and the exit status is 1
+    when a job failed.
+
+        python -m halocarbons_loader export --gases F11 F12 SF6 --programs msd cats \\
+            --gapfill --format parquet --out /data/hats --jobs 4 --cache-dir ~/.cache/hats
+"""
+
+import os
+import sys
+import json
+import argparse
+import itertools
+import importlib.util
+from time import perf_counter
+
+import halocarbon_urls
+from halocarbons_executor import Executor
+
+FORMATS = {'parquet': 'parquet', 'csv': 'csv', 'netcdf': 'nc'}
+# optional packages each format needs, any one package of each group
+REQUIRES = {'parquet': [('pyarrow', 'fastparquet')], 'netcdf': [('xarray',), ('netCDF4', 'scipy')]}
+SUMMARY = 'export_summary.json'
+
+# the loader of each worker process, made on its first job
+_hats = {}
+
+
+def export_path(out_dir, gas, program, freq, gapfill, fmt):
+    """ File written for a job. Only monthly data is gapfilled, so only
+        monthly files have the gapfill suffix. """
+    gf = '' if not gapfill or freq.lower() != 'monthly' else ('_gf' if gapfill is True else f'_gf-{gapfill}')
+    return os.path.join(out_dir, f'{gas}_{program.lower()}_{freq.lower()}{gf}.{FORMATS[fmt]}')
+
+
+def write_frame(df, path, fmt):
+    """ Write df to path as fmt, through a temporary file so a partly
+        written file never has the final name. """
+    tmp = f'{path}.tmp'
+    try:
+        if fmt == 'parquet':
+            df.to_parquet(tmp)
+        elif fmt == 'csv':
+            df.to_csv(tmp)
+        else:
+            # requires xarray and a netCDF engine
+            df.to_xarray().to_netcdf(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def export_job(gas, program, freq, options):
+    """ Load and write one (gas, program, freq). Returns the job summary,
+        errors are reported in it rather than raised. """
+    from halocarbons_loader import HATS_Loader
+
+    job = {'gas': gas, 'program': program, 'freq': freq, 'status': 'ok', 'rows': 0, 'file': None, 'error': None}
+    t0 = perf_counter()
+    try:
+        if options['base'] and halocarbon_urls.basehttp != options['base']:
+            halocarbon_urls.set_basehttp(options['base'])
+        key = (options['cache_dir'], options['serial'])
+        if key not in _hats:
+            _hats[key] = HATS_Loader(cache_dir=options['cache_dir'],
+                                     executor=Executor('serial') if options['serial'] else None)
+        hats = _hats[key]
+
+        df = hats.loader(gas, program=program, freq=freq, gapfill=options['gapfill'], verbose=False,
+                         sites=options['sites'], start=options['start'], end=options['end'])
+        job['load_seconds'] = round(perf_counter() - t0, 3)
+        if df is None or df.shape[0] == 0:
+            job['status'] = 'skipped'
+        else:
+            path = export_path(options['out_dir'], gas, program, freq, options['gapfill'], options['format'])
+            write_frame(df, path, options['format'])
+            job.update(rows=int(df.shape[0]), file=path)
+    except Exception as e:
+        url = getattr(e, 'filename', None) or getattr(e, 'url', None)
+        job.update(status='failed', error=f'{type(e).__name__}: {e}' + (f' ({url})' if url else ''))
+    job['seconds'] = round(perf_counter() - t0, 3)
+    return job
+
+
+def export(gases=None, programs=('msd',), freqs=('monthly',), out_dir='.', fmt='parquet', gapfill=False,
+           jobs=1, cache_dir=None, sites=None, start=None, end=None, verbose=True):
+    """ Export every (gas, program, freq) to out_dir with jobs parallel
+        jobs. gases defaults to every gas. Returns the summary dict that is
+        also saved in out_dir/export_summary.json. """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format: {fmt}, choose from {tuple(FORMATS)}')
+    for needs in REQUIRES.get(fmt, ()):
+        if not any(importlib.util.find_spec(m) for m in needs):
+            raise ImportError(f'{fmt} export requires {" or ".join(needs)}')
+    gases = halocarbon_urls.catalog().gases if not gases else gases
+    os.makedirs(out_dir, exist_ok=True)
+
+    options = {'out_dir': out_dir, 'format': fmt, 'gapfill': gapfill, 'cache_dir': cache_dir,
+               'sites': sites, 'start': start, 'end': end, 'base': halocarbon_urls.basehttp,
+               # with parallel jobs each job runs its gapfill serially
+               'serial': jobs > 1}
+    tasks = [(gas, program, freq, options) for gas, program, freq in itertools.product(gases, programs, freqs)]
+
+    t0 = perf_counter()
+    executor = Executor('process' if jobs > 1 else 'serial', workers=jobs)
+    try:
+        results = executor.starmap(export_job, tasks)
+    finally:
+        executor.close()
+        # loaders made in this process by serial jobs
+        for hats in _hats.values():
+            hats.close()
+        _hats.clear()
+    summary = {'seconds': round(perf_counter() - t0, 3), 'jobs': results,
+               'ok': sum(r['status'] == 'ok' for r in results),
+               'skipped': sum(r['status'] == 'skipped' for r in results),
+               'failed': sum(r['status'] == 'failed' for r in results)}
+
+    with open(os.path.join(out_dir, SUMMARY), 'w') as f:
+        json.dump(summary, f, indent=1)
+    if verbose:
+        print_summary(summary)
+    return summary
+
+
+def print_summary(summary):
+    for r in summary['jobs']:
+        where = r['file'] if r['status'] == 'ok' else (r['error'] or '')
+        print(f"{r['status']:8s} {r['gas']:10s} {r['program']:8s} {r['freq']:8s} "
+              f"{r['rows']:9d} rows {r['seconds']:8.2f} s  {where}")
+    print(f"{summary['ok']} ok, {summary['skipped']} skipped, {summary['failed']} failed "
+          f"in {summary['seconds']:.1f} s")
+
+
+def add_arguments(parser):
+    parser.add_argument('--gases', nargs='+', help='gases to export, default all')
+    parser.add_argument('--programs', nargs='+', default=['msd'], help='measurement programs')
+    parser.add_argument('--freqs', nargs='+', default=['monthly'], help='monthly, daily or hourly')
+    parser.add_argument('--gapfill', nargs='?', const=True, default=False,
+                        help='gapfill the monthly data, optionally with a method (seasonal, linear or harmonic)')
+    parser.add_argument('--format', choices=tuple(FORMATS), default='parquet')
+    parser.add_argument('--out', default='.', help='output directory')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='parallel jobs')
+    parser.add_argument('--cache-dir', help='HATS_Loader cache directory, shared by the jobs')
+    parser.add_argument('--base', help='data server or local mirror, default is halocarbon_urls.basehttp')
+    parser.add_argument('--sites', nargs='+', help='site codes, default all')
+    parser.add_argument('--start', help='first date')
+    parser.add_argument('--end', help='last date')
+    parser.add_argument('--quiet', '-q', action='store_true')
+    parser.set_defaults(func=run)
+
+
+def run(args):
+    if args.base:
+        halocarbon_urls.set_basehttp(args.base)
+    try:
+        summary = export(args.gases, args.programs, args.freqs, args.out, args.format, args.gapfill,
+                         args.jobs, args.cache_dir, args.sites, args.start, args.end, verbose=not args.quiet)
+    except (ImportError, ValueError) as e:
+        print(e)
+        return 2
+    return 1 if summary['failed'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export NOAA/GML HATS data to files.')
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
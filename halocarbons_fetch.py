@@ -0,0 +1,227 @@
+#! /usr/bin/env python
+
+""" Concurrent downloads of HATS data files in a single process.
+
+    Connection_Pool keeps HTTP(S) connections open between requests so a
+    batch of files from the same server pays for one TCP/TLS handshake per
+    connection instead of one per file. Fetcher runs many downloads at once
+    on worker threads scheduled by asyncio, limited by a semaphore, and
+    hands the raw bytes to the parsers. When an HTTP_Cache is attached the downloads go through it.
+    file:// urls (a local mirror of the data tree) are read from disk.
+"""
+
+import io
+import os
+import asyncio
+import functools
+import threading
+import http.client
+import urllib.parse
+import urllib.error
+import urllib.request
+import concurrent.futures
+
+from halocarbons_cache import fingerprint
+
+USER_AGENT = 'NOAA_halocarbons_loader'
+MAX_REDIRECTS = 5
+
+
+def local_path(url):
+    """ The path of a file:// url, None for any other url """
+    if not url.startswith('file:'):
+        return None
+    return urllib.request.url2pathname(urllib.parse.urlsplit(url).path)
+
+
+def run_async(coro):
+    """ Run a coroutine to completion. Inside a running event loop (Jupyter)
+        the coroutine is run on a separate thread with its own loop. """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(1) as ex:
+        return ex.submit(asyncio.run, coro).result()
+
+
+class Connection_Pool:
+    """ Reusable keep-alive connections, one idle list per (scheme, host). """
+
+    def __init__(self, max_idle=6, timeout=60):
+        self.max_idle = max_idle    # idle connections kept per host
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.opened = 0             # new connections (handshakes)
+        self.requests = 0
+
+    def __getstate__(self):
+        # sockets and locks can't be pickled, a copy starts with no connections
+        return {'max_idle': self.max_idle, 'timeout': self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+            self.opened += 1
+        scheme, netloc = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout), False
+        return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, key, path, headers):
+        """ One GET on a pooled connection. A reused connection the server has
+            already closed is retried once on a new connection. """
+        for attempt in range(2):
+            conn, reused = self._acquire(key)
+            try:
+                conn.request('GET', path, headers=headers)
+                r = conn.getresponse()
+                body = r.read()
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+            if r.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            return r, body
+
+    def request(self, url, headers=None):
+        """ GET url and return (status, headers, body). Redirects are followed,
+            a 304 is returned as is and errors raise urllib.error.HTTPError """
+        headers = {'User-Agent': USER_AGENT, **(headers or {})}
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            key = (parts.scheme, parts.netloc)
+            path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+            self.requests += 1
+            r, body = self._send(key, path, headers)
+
+            if r.status in (301, 302, 303, 307, 308) and r.headers.get('Location'):
+                url = urllib.parse.urljoin(url, r.headers['Location'])
+                continue
+            if r.status >= 400:
+                raise urllib.error.HTTPError(url, r.status, r.reason, r.headers, None)
+            return r.status, dict(r.headers), body
+
+        raise urllib.error.HTTPError(url, 310, 'Too many redirects', None, None)
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle = {}
+
+
+class Fetcher:
+    """ Downloads files concurrently with asyncio. At most concurrency requests
+        are in flight at once (the server complains if there are too many).
+
+        The requests themselves are blocking http.client calls (through
+        Connection_Pool and HTTP_Cache) run on worker threads with
+        asyncio.to_thread, the event loop only schedules them under the
+        semaphore. This keeps the package free of an async HTTP client
+        such as aiohttp; a download holds a thread while it waits on the
+        network, which is fine at this concurrency. """
+
+    def __init__(self, cache=None, pool=None, concurrency=6):
+        self.cache = cache
+        self.pool = pool or Connection_Pool(max_idle=concurrency)
+        self.concurrency = concurrency
+
+    def get(self, url, append=False):
+        """ Contents of url as bytes. append marks a file that only grows at
+            the end, see HTTP_Cache.get """
+        path = local_path(url)
+        if path is not None:
+            with open(path, 'rb') as f:
+                return f.read()
+        if self.cache is not None:
+            return self.cache.get(url, append=append)
+        return self.pool.request(url)[2]
+
+    def meta(self, url, append=False):
+        """ Metadata of the current version of url for fingerprint, see
+            HTTP_Cache.meta. Local files are identified by mtime and size. """
+        path = local_path(url)
+        if path is not None:
+            st = os.stat(path)
+            return {'url': url, 'etag': None, 'last_modified': f'{st.st_mtime_ns}-{st.st_size}'}
+        return self.cache.meta(url, append=append)
+
+    def open(self, url):
+        """ File like object for pandas.read_csv """
+        return io.BytesIO(self.get(url))
+
+    async def gather(self, func, items, sem, return_exceptions=False):
+        """ Await func(item) on a worker thread for every item, with at most
+            sem calls running at once. Several batches can share one sem to
+            stay under a single concurrency budget. """
+        async def one(item):
+            async with sem:
+                return await asyncio.to_thread(func, item)
+
+        return await asyncio.gather(*(one(i) for i in items), return_exceptions=return_exceptions)
+
+    async def _map(self, func, items, return_exceptions):
+        sem = asyncio.Semaphore(self.concurrency)
+        return await self.gather(func, items, sem, return_exceptions)
+
+    def map(self, func, items, return_exceptions=False):
+        """ Call func on every item concurrently and return the results in order.
+            With return_exceptions a failed item returns its exception instead
+            of raising. """
+        items = list(items)
+        if len(items) == 0:
+            return []
+        return run_async(self._map(func, items, return_exceptions))
+
+    def get_many(self, urls, return_exceptions=False, append=False):
+        """ Download every url concurrently, returns a list of bytes in the same order. """
+        return self.map(functools.partial(self.get, append=append), urls, return_exceptions=return_exceptions)
+
+    def fingerprint(self, urls, append=False):
+        """ Revalidate urls concurrently and hash their current content. Needs a
+            cache unless the urls are local files. """
+        return fingerprint(self.map(functools.partial(self.meta, append=append), urls))
+
+
+class Preloaded_Fetcher(Fetcher):
+    """ Serves files that were already downloaded (for example by
+        HATS_Loader.load_many), anything else is downloaded as usual. """
+
+    def __init__(self, fetcher, data):
+        super().__init__(cache=fetcher.cache, pool=fetcher.pool, concurrency=fetcher.concurrency)
+        self.data = data    # url: bytes
+
+    def get(self, url, append=False):
+        if url in self.data:
+            return self.data[url]
+        return super().get(url, append=append)
+
+    def get_many(self, urls, return_exceptions=False, append=False):
+        urls = list(urls)
+        if all(url in self.data for url in urls):
+            return [self.data[url] for url in urls]
+        return super().get_many(urls, return_exceptions=return_exceptions, append=append)
@@ -1,7 +1,8 @@
 #! /usr/bin/env python
 
 import pandas as pd
-import altair as alt
+
+from halocarbons_analysis import program_matrix, program_pairs
 
 
 class HATS_Figures:
@@ -13,6 +14,7 @@ class HATS_Figures:
     def multi_station_figure(self, prog_df, errorbars=True):
         """ Creates an interactive figure with data from all sample locations
             for a measurement program. prog_df is a pandas dataframe. """
+        import altair as alt
 
         # return if dataframe is empty
         if prog_df is None:
@@ -115,6 +117,7 @@ class HATS_Figures:
     def multi_program_figure(self, site, prog_df, errorbars=True):
         """ Creates an interactive figure with data from all sampling programs
             at a single station (site). prog_df is a pandas dataframe. """
+        import altair as alt
 
         # return if dataframe is empty
         if prog_df is None:
@@ -189,29 +192,19 @@ class HATS_Figures:
             df_org is a multi_instrument_dataframe
             prog0 and prog1 are strings that match the prog column in df_org """
 
-        # find the sites that are in common to both prog0 and prog1
-        s0 = df_org.loc[df_org.prog == prog0].site.unique()
-        s1 = df_org.loc[df_org.prog == prog1].site.unique()
-        common_sites = set(s0) & set(s1)
+        pairs = program_pairs(program_matrix(df_org), [(prog0, prog1)])
 
-        dfs = []
-        for site in common_sites:
-            sdf = df_org.loc[df_org.site == site].copy()
-            sdf['ratio'] = sdf.loc[sdf.prog == prog0].mf / sdf.loc[sdf.prog == prog1].mf
-            sdf.drop(['mf', 'sd', 'lat', 'lon', 'elev', 'prog'], axis=1, inplace=True)
-            dfs.append(sdf)
-
-        # no common_sites found, return an empty dataframe
-        if len(dfs) == 0:
+        # no dates in common, return an empty dataframe
+        if len(pairs) == 0:
             return pd.DataFrame()
 
-        sdf = pd.concat(dfs).dropna()
-        return sdf
+        return pairs[['ratio']].reset_index('site')
 
     def site_ratios_figure(self, df0, df1):
         """ Generates a figure of ratios for each site.
             df0 and df1 are Pandas data frames returned from the halocarbons_loader
             method. """
+        import altair as alt
 
         if df0 is None or df1 is None:
             return
@@ -220,9 +213,9 @@ class HATS_Figures:
         prog0 = df0.attrs['program']
         prog1 = df1.attrs['program']
 
-        measurements = self.multi_instrument_dataframe([df0, df1])
-        df = self.return_ratios(measurements, prog0, prog1)
-        mm = df.groupby('date').mean()
+        pairs = program_pairs(program_matrix({prog0: df0, prog1: df1}), [(prog0, prog1)])
+        df = pairs[['ratio']].reset_index('site')
+        mm = df.groupby('date')[['ratio']].mean()
 
         line = alt.Chart(df.reset_index()).mark_line().encode(
             x=alt.X('date:T',
@@ -17,27 +17,169 @@
     UPDATED: 2025-06-17 for Python 3.10+ compatibility
 """
 
+import io
+import os
+import asyncio
+import hashlib
+import functools
+import concurrent.futures
+import numpy as np
 import pandas as pd
 from datetime import datetime
-import multiprocessing as mp
 from time import time, sleep
 
 import halocarbon_urls
-from gapfill import Gap_Methods
+from gapfill import Gap_Methods, time_interpolate
+from halocarbons_cache import HTTP_Cache, Results_Cache, Rows_Cache, Model_Cache, fingerprint as files_fingerprint
+from halocarbons_executor import Executor
+from halocarbons_fetch import Connection_Pool, Fetcher, Preloaded_Fetcher, run_async
+
+
+def assemble_dates(year, month, day=1, hour=0, minute=0):
+    """ datetime64[ns] array from integer date parts (columns or scalars),
+        computed with NumPy instead of formatting and parsing strings.
+        Missing or invalid parts give NaT, like pd.to_datetime(errors='coerce'). """
+    parts = np.broadcast_arrays(*(np.asarray(pd.to_numeric(p, errors='coerce'), dtype='float64')
+                                  for p in (year, month, day, hour, minute)))
+    ok = np.logical_and.reduce([np.isfinite(p) & (p == np.floor(p)) for p in parts])
+    y, m, d, h, mi = (np.where(ok, p, 1).astype('int64') for p in parts)
+    ok &= (m >= 1) & (m <= 12) & (d >= 1) & (h >= 0) & (h < 24) & (mi >= 0) & (mi < 60)
+
+    months = ((y - 1970) * 12 + m - 1).astype('datetime64[M]')
+    first = months.astype('datetime64[D]')
+    ok &= d <= ((months + 1).astype('datetime64[D]') - first).astype('int64')
+
+    dates = (first + (d - 1)).astype('datetime64[ns]') + (h * 60 + mi).astype('timedelta64[m]')
+    dates[~ok] = np.datetime64('NaT')
+    return dates
+
+
+GAPFILL_METHODS = ('seasonal', 'linear', 'harmonic')
+COUNT_COLUMNS = ('n', 'pid')     # integer counts and ids stored as float because of NaNs
+PARSE_ROWS = 200_000    # rows parsed at a time by the chunked readers
+
+
+@functools.lru_cache(maxsize=None)
+def site_table():
+    """ Site info from the GML DB (sites.csv) indexed by site code, read once
+        per process. """
+    # sites.csv is next to this module, wherever it is run from
+    df = pd.read_csv(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sites.csv'))
+    return df.set_index('site')
+
+
+def compact_frame(df, float32=False):
+    """ A smaller copy of a loaded frame: string columns become categorical,
+        the COUNT_COLUMNS the smallest integer type that holds them (nullable
+        if they have NaNs) and with float32 the other float64 columns become
+        float32 (7 significant digits, more than the measurements have). The
+        index is left as it is, its site level already stores each code once.
+        The frame is compacted after it is loaded and gapfilled, so only the
+        frame that is kept is smaller, the peak memory of the load is not. """
+    out = {}
+    for col, s in df.items():
+        if isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(s.dtype):
+            pass
+        elif pd.api.types.is_object_dtype(s.dtype) or pd.api.types.is_string_dtype(s.dtype):
+            s = s.astype('category')
+        elif col in COUNT_COLUMNS and pd.api.types.is_numeric_dtype(s.dtype) \
+                and np.all(np.mod(s.dropna().to_numpy(), 1) == 0):
+            s = compact_counts(s)
+        elif float32 and s.dtype == 'float64':
+            s = s.astype('float32')
+        out[col] = s
+    compact = pd.DataFrame(out, index=df.index)
+    compact.attrs = dict(df.attrs)
+    return compact
+
+
+def compact_counts(s):
+    """ Whole number series as the smallest integer dtype that holds it """
+    vals = s.dropna()
+    lo, hi = (int(vals.min()), int(vals.max())) if len(vals) else (0, 0)
+    dtype = np.result_type(np.min_scalar_type(lo), np.min_scalar_type(hi)).name
+    if len(vals) < len(s):
+        # pandas nullable integer, UInt8, Int16, ...
+        dtype = dtype.replace('uint', 'UInt').replace('int', 'Int')
+    return s.astype(dtype)
+
+
+def date_bounds(start=None, end=None):
+    """ start and end as Timestamps (or None). A date string for end includes
+        its whole period, like partial string indexing: end='2011' is up to
+        the end of 2011 and end='2012-12-31' includes all the hours of that
+        day. """
+    if start is not None:
+        start = pd.Timestamp(start)
+    if end is not None:
+        end = pd.Period(end).end_time if isinstance(end, str) else pd.Timestamp(end)
+    return start, end
+
+
+def in_range(df, start=None, end=None):
+    """ Rows of df dated from start to end inclusive, either can be None. The
+        dates are the 'date' index level or the 'date' column, end is read as
+        in date_bounds. """
+    if start is None and end is None:
+        return df
+    start, end = date_bounds(start, end)
+    dates = df.index.get_level_values('date') if 'date' in df.index.names else df['date']
+    keep = np.ones(len(df), dtype=bool)
+    if start is not None:
+        keep &= dates >= start
+    if end is not None:
+        keep &= dates <= end
+    return df[keep]
+
+
+def subset_sites(sites, wanted):
+    """ The sites in wanted (all of them if wanted is None), in the order of sites """
+    if wanted is None:
+        return list(sites)
+    wanted = {wanted.lower()} if isinstance(wanted, str) else {w.lower() for w in wanted}
+    return [s for s in sites if s in wanted]
 
 
 class HATS_Loader(halocarbon_urls.HATS_MSD_URLs):
 
-    def __init__(self):
+    def __init__(self, cache_dir=None, cache_max_bytes=2 * 1024**3, io_concurrency=6, executor=None):
+        """ Set cache_dir to keep a local copy of downloaded files. Cached files
+            are revalidated with the server on each load and the least recently
+            used files are removed once the cache grows past cache_max_bytes.
+            Parsed results are also kept (as Parquet) in cache_dir/results and
+            reused until one of their source files changes. The hourly in situ
+            files only grow, when they change just the new end of the file is
+            downloaded and parsed (the parsed rows are kept in cache_dir/rows).
+            Fitted seasonal gapfill models are kept in cache_dir/models and
+            only refitted for sites whose data changed. The results, rows and
+            models count toward cache_max_bytes and are evicted least
+            recently used first along with the downloaded files.
+            Files are downloaded over a shared pool of keep-alive connections,
+            at most io_concurrency at once.
+            executor (an Executor, default a thread pool with one worker per
+            cpu) parses the site files. With a process executor each task gets
+            the bytes of one file and returns its parsed frame. Its pools are
+            kept for later loads, call close() to stop them. """
         super().__init__()
+        self.pool = Connection_Pool(max_idle=io_concurrency)
+        self.executor = executor or Executor('thread')
+        if cache_dir:
+            self.cache = HTTP_Cache(cache_dir, max_bytes=cache_max_bytes, pool=self.pool)
+            self.results = Results_Cache(os.path.join(self.cache.cache_dir, 'results'))
+            self.rows = Rows_Cache(os.path.join(self.cache.cache_dir, 'rows'))
+            self.models = Model_Cache(os.path.join(self.cache.cache_dir, 'models'))
+        else:
+            self.cache = None
+            self.results = None
+            self.rows = None
+            self.models = None
+        self.fetcher = Fetcher(cache=self.cache, pool=self.pool, concurrency=io_concurrency)
         # list of all gases available on FTP site
         self.gases = list(self.urls.keys())     # MSD gases
         self.gases.append('N2O')    # add N2O and CCl4 (non MSD gases)
         self.gases.append('CCl4')
         self.gases = sorted(self.gases)
         self.gasloaded = ''
-        # pandas data frame with GML site info
-        self.gml_sites = self.gml_sites()
         # background air measurement sites
         self.bk_sites = ('alt', 'sum', 'brw', 'cgo', 'kum', 'mhd', 'mlo', 'nwr', 'thd', 'smo', 'ush', 'psa', 'spo')
         self.programs_msd = ('m3', 'pr1', 'msd')
@@ -45,19 +187,156 @@ class HATS_Loader(halocarbon_urls.HATS_MSD_URLs):
         self.programs_flaskECD = ('oldgc', 'otto', 'fecd')
         self.programs_combined = ('combined', 'combine', 'combo')
 
+    @property
     def gml_sites(self):
-        """ Site info from the GML DB """
-        try:
-            df = pd.read_csv('sites.csv')
-        except FileNotFoundError:
-            # path if cloned from github
-            df = pd.read_csv('NOAA_halocarbons_loader/sites.csv')
+        """ pandas data frame with GML site info, sites.csv is only read
+            when it is first needed. """
+        return site_table().reset_index()
+
+    def loader(self, gas, program='msd', freq='monthly', gapfill=False, addlocation=True, verbose=True,
+               sites=None, start=None, end=None, compact=False):
+        """ Main loader method. gapfill is True for the usual method of the
+            program or one of GAPFILL_METHODS. sites (a list of site codes) and start / end
+            (inclusive dates) limit what is loaded: only the files of those
+            sites are downloaded and rows outside the dates are dropped while
+            parsing, before gapfill and add_location. compact=True returns the
+            memory compact frame of compact_frame, compact='float32' also
+            stores the measurements as float32. The full frame is still built
+            first, sites and start / end are what lower the peak memory. """
+        plan = self._plan(gas, program, freq, gapfill, verbose, sites=sites, start=start, end=end)
+        if plan is None:
+            return
+        gas, program, freq, gapfill, hats = plan
+        self.gasloaded = gas
+
+        # fingerprint of the source files, keys the parsed results cache
+        fingerprint = None
+        if self.results is not None and self.results.enabled:
+            urls = hats.source_urls(gas, freq)
+            if urls:
+                fingerprint = self.fetcher.fingerprint(urls, append=(freq == 'hourly'))
+
+        df = self._load(hats, gas, program, freq, gapfill, addlocation, fingerprint,
+                        self._subset_key(sites, start, end))
+        if compact and df is not None:
+            df = compact_frame(df, float32=(compact == 'float32'))
         return df
 
-    def loader(self, gas, program='msd', freq='monthly', gapfill=False, addlocation=True, verbose=True):
-        """ Main loader method. """
+    def load_many(self, gases=None, programs=('msd',), freq='monthly', gapfill=False, addlocation=True,
+                  long_form=False, progress=True, verbose=False, sites=None, start=None, end=None,
+                  compact=False):
+        """ Load several gases from several programs in one batch. Every source
+            file is planned up front and downloaded under the fetcher's
+            concurrency limit, and items are parsed as soon as their files
+            arrive so parsing overlaps the remaining downloads. Gases that are
+            not measured (at all or by a program) are skipped, with the reason
+            in self.skipped[(gas, program)], so they can be told apart from
+            items that loaded no rows. A failed item does not stop the batch,
+            its exception is kept in self.errors[(gas, program)].
+            sites, start, end and compact work as in loader.
+
+            Returns a dict {(gas, program): DataFrame}, or with long_form a
+            single DataFrame with 'gas' and 'program' columns. """
+        gases = self.gases if gases is None else gases
+        gases = [gases] if isinstance(gases, str) else gases
+        programs = [programs] if isinstance(programs, str) else programs
+        self.errors = {}
+        self.skipped = {}
+
+        plans = {}
+        for gas in gases:
+            # resolved once, not for every program
+            proper = halocarbon_urls.catalog().resolve(gas)
+            if proper is None:
+                print(f'NOAA/GML does not measure {gas}')
+                self.skipped.update({(gas, program.lower()): 'not measured by NOAA/GML' for program in programs})
+                continue
+            for program in programs:
+                try:
+                    plan = self._plan(proper, program, freq, gapfill, verbose, sites=sites, start=start, end=end)
+                    if plan is None:
+                        self.skipped[(proper, program.lower())] = 'unknown program or gapfill method'
+                        continue
+                    urls = plan[4].source_urls(plan[0], plan[2])
+                except Exception as e:
+                    self.errors[(proper, program.lower())] = e
+                    print(f'Could not plan {gas} {program}: {e}')
+                    continue
+                if urls:
+                    plans[(plan[0], plan[1])] = (plan, urls)
+                else:
+                    self.skipped[(plan[0], plan[1])] = f'not measured by the {plan[1]} program'
+
+        subset = self._subset_key(sites, start, end)
+        results = run_async(self._load_many(plans, addlocation, progress, subset))
+        # same order as requested
+        results = {key: results[key] for key in plans if key in results}
+
+        float32 = compact == 'float32'
+        if long_form:
+            frames = [df.reset_index().assign(gas=gas, program=program)
+                      for (gas, program), df in results.items()]
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            return compact_frame(df, float32) if compact else df
+        if compact:
+            results = {key: compact_frame(df, float32) for key, df in results.items()}
+        return results
+
+    async def _load_many(self, plans, addlocation, progress, subset=''):
+        """ Run the items planned by load_many, returns {(gas, program): df} """
+        net = asyncio.Semaphore(self.fetcher.concurrency)
+        # parsing is CPU bound, at most one item per executor worker is parsed
+        # while the downloads for the other items carry on
+        cpu = asyncio.Semaphore(self.executor.workers)
+
+        async def job(plan, urls):
+            gas, program, freq, gapfill, hats = plan
+            # hourly files only grow at the end
+            append = freq == 'hourly'
+            fingerprint = None
+            if self.results is not None and self.results.enabled:
+                meta = functools.partial(self.fetcher.meta, append=append)
+                fingerprint = files_fingerprint(await self.fetcher.gather(meta, urls, net))
+
+            # no need to download anything if the result is already cached
+            data = {}
+            if not (fingerprint and self.results.has(gas, program, freq, gapfill, fingerprint, subset)):
+                get = functools.partial(self.fetcher.get, append=append)
+                data = dict(zip(urls, await self.fetcher.gather(get, urls, net)))
+            hats.fetcher = Preloaded_Fetcher(self.fetcher, data)
+
+            async with cpu:
+                return await asyncio.to_thread(self._load, hats, gas, program, freq, gapfill,
+                                               addlocation, fingerprint, subset)
+
+        async def run(key, plan, urls):
+            try:
+                return key, await job(plan, urls), None
+            except Exception as e:
+                return key, None, e
+
+        results = {}
+        tasks = [run(key, plan, urls) for key, (plan, urls) in plans.items()]
+        for n, task in enumerate(asyncio.as_completed(tasks), 1):
+            key, df, err = await task
+            if err is not None:
+                self.errors[key] = err
+                msg = f'failed: {err}'
+            elif df is None:
+                msg = 'no data'
+            else:
+                results[key] = df
+                msg = f'{df.shape[0]} rows'
+            if progress:
+                print(f'[{n}/{len(tasks)}] {key[0]} {key[1]} {msg}')
+        return results
+
+    def _plan(self, gas, program, freq, gapfill, verbose, fetcher=None, sites=None, start=None, end=None):
+        """ Resolve the gas name and program and create the program class.
+            Returns (gas, program, freq, gapfill, hats) or None for an unknown
+            program. """
         gas = self.gas_conversion(gas)
-        self.gasloaded = gas
+        fetcher = fetcher or self.fetcher
 
         program = program.lower()
         freq = freq.lower()
@@ -66,47 +345,78 @@ class HATS_Loader(halocarbon_urls.HATS_MSD_URLs):
             print(f'The MSD program does not measure {gas} the returned cats_results are from the Combined Data Set.')
             program = 'combined'
 
+        subset = dict(sites=sites, start=start, end=end)
         if program in self.programs_msd:
-            hats = MSDs(verbose=verbose)
-            if freq == 'pairs':
-                df = hats.pairs(gas)
-            else:
-                df = hats.monthly(gas)
-
+            hats = MSDs(verbose=verbose, fetcher=fetcher, **subset)
         elif program in self.programs_insitu:
-            hats = insitu(verbose=verbose, prog=program)
-            df = hats.insitu_loader(gas, freq=freq)
-
+            hats = insitu(verbose=verbose, prog=program, fetcher=fetcher, rows=self.rows,
+                          executor=self.executor, **subset)
         elif program in self.programs_flaskECD:
-            hats = Flasks(verbose=verbose, prog=program)
-            df = hats.flask_loader(gas, freq=freq)
-
+            hats = Flasks(verbose=verbose, prog=program, fetcher=fetcher, executor=self.executor, **subset)
         elif program in self.programs_combined:
-            hats = Combined(verbose=verbose)
-            df = hats.combo_loader(gas)
-
+            # global and hemispheric means, there are no sites to select
+            hats = Combined(verbose=verbose, fetcher=fetcher, start=start, end=end)
         else:
             print(f'Unknown measurement program: {program}')
             return
 
-        # the loader did not return any data
-        if df.shape[0] == 0:
-            return
+        # combined data already gapfilled
+        if gapfill and (freq == 'monthly') and program not in self.programs_combined:
+            # True picks the usual method of the program
+            if gapfill is True:
+                gapfill = 'linear' if program == 'oldgc' else 'seasonal'
+            if gapfill not in GAPFILL_METHODS:
+                print(f'Unknown gapfill method: {gapfill}, choose from {GAPFILL_METHODS}')
+                return
+        else:
+            gapfill = False
+        return gas, program, freq, gapfill, hats
+
+    def _load(self, hats, gas, program, freq, gapfill, addlocation, fingerprint, subset=''):
+        """ Load (or fetch from the results cache), gapfill and add locations.
+            subset is the results cache key of the sites and dates selected. """
+        df = self._cached(gas, program, freq, gapfill, fingerprint, subset)
+        if df is None:
+            df = self._cached(gas, program, freq, False, fingerprint, subset) if gapfill else None
+            if df is None:
+                df = self._load_program(hats, gas, freq)
+                self._store(df, gas, program, freq, False, fingerprint, subset)
 
-        if gapfill and (freq == 'monthly'):
-            if program not in self.programs_combined:    # combined data already gapfilled
+            # the loader did not return any data
+            if df.shape[0] == 0:
+                return
+
+            if gapfill:
                 t0 = time()
                 sites = set(df.reset_index()['site'])
-                method = 'linear' if program == 'oldgc' else 'seasonal'
+                method = gapfill
                 print(f'{method} gapfill started')
-                with mp.Pool() as p:
-                    res = p.starmap(self.gapfiller, [(df, s, method) for s in sites])
+                if method == 'linear' and 'mf' in df.columns:
+                    res = [self.linear_gapfill(df)]
+                elif method in ('seasonal', 'harmonic') and 'mf' in df.columns:
+                    if method == 'seasonal':
+                        # one batched Holt-Winters fit for all of the sites
+                        models = self.models.get(gas, program) if self.models else None
+                        fits = Gap_Methods().seasonal_sites(df, forecast_periods=12, models=models)
+                        if self.models:
+                            self.models.put(models, gas, program)
+                            self.cache.evict()
+                    else:
+                        gap = Gap_Methods()
+                        fits = {s: gap.harmonic(df.loc[s], forecast_periods=12) for s in sites
+                                if df.loc[s, 'mf'].notna().any()}
+                    res = [self._gapfill_join(df.loc[s], s, self._seasonal_gf(fits[s]))
+                           if s in fits else self._gapfill_join(df.loc[s], s) for s in sites]
+                else:
+                    # no 'mf' column, nothing to fill
+                    res = [self._gapfill_join(df.loc[s], s) for s in sites]
 
                 df = pd.concat(res)
                 df.reset_index(inplace=True)
                 df.set_index(['site', 'date'], inplace=True)
                 df.sort_index(inplace=True)
                 #print(f'gapfiller took {time()-t0:.1f} seconds')
+                self._store(df, gas, program, freq, gapfill, fingerprint, subset)
 
         # insert lat, lon, elev into dataframe
         if program not in self.programs_combined and addlocation:
@@ -118,62 +428,79 @@ class HATS_Loader(halocarbon_urls.HATS_MSD_URLs):
 
         return df
 
+    def close(self):
+        """ Stop the executor pools and close idle connections. """
+        self.executor.close()
+        self.pool.close()
+
+    def _load_program(self, hats, gas, freq):
+        """ Read and parse the data files for one of the program classes. """
+        if isinstance(hats, MSDs):
+            if freq == 'pairs':
+                return hats.pairs(gas)
+            return hats.monthly(gas)
+        elif isinstance(hats, insitu):
+            return hats.insitu_loader(gas, freq=freq)
+        elif isinstance(hats, Flasks):
+            return hats.flask_loader(gas, freq=freq)
+        return hats.combo_loader(gas)
+
+    def _cached(self, gas, program, freq, gapfill, fingerprint, subset=''):
+        if fingerprint is None:
+            return None
+        return self.results.get(gas, program, freq, gapfill, fingerprint, subset)
+
+    def _store(self, df, gas, program, freq, gapfill, fingerprint, subset=''):
+        if fingerprint is not None:
+            self.results.put(df, gas, program, freq, gapfill, fingerprint, subset)
+            self.cache.evict()
+
+    def _subset_key(self, sites, start, end):
+        """ Results cache key for a selection of sites and dates, '' for everything """
+        if sites is None and start is None and end is None:
+            return ''
+        if sites is not None:
+            sites = sorted({sites.lower()} if isinstance(sites, str) else {s.lower() for s in sites})
+        # the bounds in_range selects, end='1995' and end='1995-01-01' differ
+        dates = [None if d is None else str(d) for d in date_bounds(start, end)]
+        return hashlib.sha256(repr((sites, dates)).encode()).hexdigest()[:12]
+
     def add_location(self, df_org):
-        df = (
-            df_org
-            .copy()
-            .reset_index()
-            # make a new column that uppercases and strips off any "_pfp" suffix
-            .assign(site_lookup=lambda d: d['site']
-                    .str.replace('_pfp$', '', regex=True)
-                    .str.upper())
-            # merge once against your site metadata
-            .merge(
-                self.gml_sites.rename(columns={'site': 'site_lookup'}),
-                on='site_lookup',
-                how='left'
-            )
-            # drop the helper column if you want
-            .drop(columns=['site_lookup'])
-            .set_index(['site', 'date'])
-        )
+        """ Add the site name, lat, lon and elev columns. Only the distinct
+            site codes are looked up in the site table, the rows take their
+            values through the codes of the site index level, and the
+            measurement columns are not copied. """
+        index = df_org.index
+        if isinstance(index, pd.MultiIndex):
+            level = index.names.index('site')
+            codes, uniques = index.codes[level], index.levels[level]
+        else:
+            codes, uniques = pd.factorize(index.get_level_values('site'))
+
+        # uppercase and strip off any "_pfp" suffix
+        lookup = pd.Index(uniques).astype(str).str.replace('_pfp$', '', regex=True).str.upper()
+        info = site_table().reindex(lookup)
+
+        df = df_org.copy(deep=False)
+        missing = codes < 0
+        for col in info.columns:
+            values = info[col].take(codes)
+            if missing.any():
+                values = values.where(~missing)
+            df[col] = values.array
         return df
 
     def gas_conversion(self, gas):
         """ Converts a gas string to the correct upper and lower case. The dict
             subs are substitutions or commonly used aliases. """
 
-        # N2O and CCl4 are not in the self.gases list
-        # the keys should be in all uppercase
-        subs = {'F11B': 'F11', 'COS': 'OCS',
-                'MC': 'CH3CCl3', 'CT': 'CCl4',
-                '1211': 'h1211', '1301': 'h1301', '2402': 'h2402',
-                'CFC11': 'F11', 'CFC12': 'F12', 'CFC113': 'F113',
-                '11': 'F11', '113': 'F113', '114': 'F114', '115': 'F115',
-                '12': 'F12', '13': 'F13',
-                '123': 'HCFC123', '124': 'HCFC124', '133A': 'HCFC133a', '133': 'HCFC133a',
-                '141B': 'HCFC141b', '141': 'HCFC141b', '142B': 'HCFC142b', '142': 'HCFC142b',
-                '22': 'HCFC22', '125': 'HFC125', '134A': 'HFC134a', '134': 'HFC134a',
-                '143A': 'HFC143a', '143': 'HFC143a', '152A': 'HFC152a', '152': 'HFC152a',
-                'PCE': 'C2Cl4'}
-
-        # first compare to substitutions
-        if gas.upper() in subs:
-            proper = subs[gas.upper()]
-        # now compare to the gases in the urls key
-        elif gas.casefold() in (g.casefold() for g in self.gases):
-            proper = self._casecompare(gas)
-        else:
+        # substitutions (halocarbon_urls.GAS_ALIASES) and the gases of the url catalog
+        proper = halocarbon_urls.catalog().resolve(gas)
+        if proper is None:
             print(f'NOAA/GML does not measure {gas}')
             proper = gas
         return proper
 
-    def _casecompare(self, gas):
-        """ Returns the correct case as it appears in self.gases """
-        for g in self.gases:
-            if gas.casefold() == g.casefold():
-                return g
-
     def mf_units(self, gas):
         units = '(ppb)' if gas == 'N2O' else '(ppt)'
         return units
@@ -191,37 +518,77 @@ class HATS_Loader(halocarbon_urls.HATS_MSD_URLs):
         plt.title('Background Stations')
         plt.show()
 
+    @staticmethod
+    def linear_gapfill(df):
+        """ gapfiller(method='linear') for all of the sites at once: mf is
+            interpolated in time between the first and last good points of
+            each site, missing sd take the median sd of the site and the
+            other numeric columns are time-interpolated. """
+        gf = Gap_Methods().linear_sites(df)
+        out = gf.drop(columns=['gf', 'gfsd'], errors='ignore')
+        out['mf'] = gf['gf']
+        if 'gfsd' in gf.columns:
+            out['sd'] = gf['gfsd']
+        out = out.infer_objects()
+
+        # interpolate all of the other numeric columns
+        to_interp = [c for c in out.select_dtypes('number').columns if c != 'mf']
+        if to_interp:
+            out[to_interp] = time_interpolate(out[to_interp].to_numpy(dtype=float),
+                                              out.index.get_level_values(1).asi8.astype(float),
+                                              out.index.codes[0])
+        out.index = out.index.set_names(['site', 'date'])
+        return out
+
     def gapfiller(self, df, site, method='seasonal'):
         """
         Fill gaps in the 'mf' series for a single site, then
         re-attach the other columns and time-interpolate them.
         """
+        return self.gapfill_site(df.loc[site], site, method)
+
+    @staticmethod
+    def gapfill_site(sub_df, site, method='seasonal'):
+        """ gapfiller for the rows of one site (indexed by date). """
         gap = Gap_Methods()
-        sub_df = df.loc[site]
 
         # If there is no 'mf' in this slice, just return it unmodified:
         if 'mf' not in sub_df.columns:
-            result = sub_df.copy()
-            result.rename_axis('date', inplace=True)
-            result['site'] = site
-            return result
+            return HATS_Loader._gapfill_join(sub_df, site)
 
         # 1) do the seasonal vs. linear gap‐fill
         if method == 'seasonal':
-            gf = gap.seasonal(sub_df, forecast_periods=12)
-            gf['mf_raw'] = gf['mf']
-            gf['mf']     = gf['mf_filled']
-            gf.drop(columns=['mf_filled'], inplace=True)
+            gf = HATS_Loader._seasonal_gf(gap.seasonal(sub_df, forecast_periods=12))
+        elif method == 'harmonic':
+            gf = HATS_Loader._seasonal_gf(gap.harmonic(sub_df, forecast_periods=12))
         elif method == 'linear':
-            gf = gap.linear(sub_df)
-            gf['mf'] = gf['gf']
-            gf['sd'] = gf['gfsd']
-            gf.drop(columns=['gf', 'gfsd'], inplace=True)
+            gf = gap.linear(sub_df)[['gf', 'gfsd']]
+            gf.columns = ['mf', 'sd']
         else:
             raise ValueError(f"Unknown gap‐fill method: {method}")
 
+        return HATS_Loader._gapfill_join(sub_df, site, gf)
+
+    @staticmethod
+    def _seasonal_gf(gf):
+        """ Seasonal fit output to gapfiller columns: mf is the filled series
+            and mf_raw the original. """
+        gf['mf_raw'] = gf['mf']
+        gf['mf']     = gf['mf_filled']
+        return gf.drop(columns=['mf_filled'])
+
+    @staticmethod
+    def _gapfill_join(sub_df, site, gf=None):
+        """ Re-attach the other columns of a site to its gap-filled mf and
+            time-interpolate them. Without gf the site is returned as is. """
+        if gf is None:
+            result = sub_df.copy()
+            result.rename_axis('date', inplace=True)
+            result['site'] = site
+            return result
+
         # 2) re-join the non‐mf columns from the original
-        df_merged = gf.join(sub_df.drop(columns=['mf']), how='left')
+        df_merged = gf.join(sub_df.drop(columns=sub_df.columns.intersection(gf.columns)), how='left')
 
         # 3) infer proper dtypes (so interpolate has numeric dtypes, not object)
         df_merged = df_merged.infer_objects(copy=False)
@@ -269,9 +636,23 @@ class MSDs(halocarbon_urls.HATS_MSD_URLs):
     """ More info about the flask program can be found here:
         https://gml.noaa.gov/hats/flask/flasks.html """
 
-    def __init__(self, verbose=True):
+    def __init__(self, verbose=True, fetcher=None, sites=None, start=None, end=None):
         super().__init__()
         self.verbose = verbose
+        self.fetcher = fetcher or Fetcher()
+        # only rows for these sites and dates are kept
+        self.wanted_sites = sites
+        self.start, self.end = start, end
+
+    def source_urls(self, gas, freq='monthly'):
+        """ URLs of the files read for gas """
+        return [self.urls[gas]] if gas in self.urls else []
+
+    def _select(self, msd):
+        """ Rows of a parsed chunk for the selected sites and dates """
+        if self.wanted_sites is not None:
+            msd = msd.loc[msd['site'].isin(subset_sites(msd['site'].unique(), self.wanted_sites))]
+        return in_range(msd, self.start, self.end)
 
     def pairs(self, gas):
         """ Load MSD flask pair means """
@@ -289,42 +670,53 @@ class MSDs(halocarbon_urls.HATS_MSD_URLs):
         # determine file type "M3" or "PR1"
         type = 'PR1' if filename.find('PR1') > 0 else 'GCMS'
 
+        # parse a chunk at a time and keep only the selected rows of each
         if type == 'GCMS':
-            msd = pd.read_csv(filename, sep='\\s+', header=1,
+            reader = pd.read_csv(self.fetcher.open(filename), sep='\\s+', header=1,
                 names=['site', 'dec_date', 'yyymmdd', 'hhmmss', 'wind_dir', 'wind_spd', 'mf', 'sd'],
-                na_values=['nd', '0.0'])
-            msd['inst'] = 'M3'
-
-            msd['date'] = pd.to_datetime(
-                msd['yyymmdd'].astype(str) + msd['hhmmss'].astype(str),
-                format='%Y%m%d%H%M',
-                errors='coerce'
-            )
-
-            # Make it your index and (optionally) drop the raw columns
-            msd.set_index('date', inplace=True)
-            msd.drop(columns=['yyymmdd', 'hhmmss'], inplace=True)
-            msd['inst'] = 'M3'
-
+                na_values=['nd', '0.0'], chunksize=PARSE_ROWS)
+            parse = self._gcms_chunk
         else:  # PR1 file type
-            msd = pd.read_csv(filename, sep='\\s+', header=1, comment='#',
+            reader = pd.read_csv(self.fetcher.open(filename), sep='\\s+', header=1, comment='#',
                 names=['site', 'dec_date', 'yyymmdd', 'hhmm', 'wind_dir', 'wind_spd', 'mf', 'sd', 'flag', 'inst'],
-                na_values=['nd', '0.0'])
-            msd['site'] = msd['site'].str.lower()
-            # use only background "-" flagged data not ">" or "<"
-            msd = msd.loc[msd.flag == '-']
+                na_values=['nd', '0.0'], chunksize=PARSE_ROWS)
+            parse = self._pr1_chunk
 
-            msd['date'] = pd.to_datetime(
-                msd['yyymmdd'].astype(str) + msd['hhmm'].astype(str),
-                format='%Y%m%d%H:%M',
-                errors='coerce'
-            )
+        chunks = [self._select(parse(chunk)) for chunk in reader]
+        if not chunks:
+            return pd.DataFrame()
+        msd = pd.concat(chunks)
 
         msd.reset_index(inplace=True)
         self.sites = msd['site'].unique()
         msd.set_index(['site', 'date'], inplace=True)
         return msd
 
+    def _gcms_chunk(self, msd):
+        msd['inst'] = 'M3'
+
+        # yyyymmdd and hhmm integers
+        ymd = pd.to_numeric(msd['yyymmdd'], errors='coerce')
+        hm = pd.to_numeric(msd['hhmmss'], errors='coerce')
+        msd['date'] = assemble_dates(ymd // 10000, ymd // 100 % 100, ymd % 100, hm // 100, hm % 100)
+
+        # Make it your index and (optionally) drop the raw columns
+        msd.set_index('date', inplace=True)
+        msd.drop(columns=['yyymmdd', 'hhmmss'], inplace=True)
+        msd['inst'] = 'M3'
+        return msd
+
+    def _pr1_chunk(self, msd):
+        msd['site'] = msd['site'].str.lower()
+        # use only background "-" flagged data not ">" or "<"
+        msd = msd.loc[msd.flag == '-'].copy()
+
+        # yyyymmdd integer and hh:mm string
+        ymd = pd.to_numeric(msd['yyymmdd'], errors='coerce')
+        hm = pd.to_numeric(msd['hhmm'].astype(str).str.replace(':', '', regex=False), errors='coerce')
+        msd['date'] = assemble_dates(ymd // 10000, ymd // 100 % 100, ymd % 100, hm // 100, hm % 100)
+        return msd
+
     def monthly(self, gas):
         """
         Compute monthly means from flask pair means for the specified gas.
@@ -357,19 +749,53 @@ class MSDs(halocarbon_urls.HATS_MSD_URLs):
         
         return monthly
 
-class insitu(halocarbon_urls.insitu_URLs):
+class Site_Parser:
+    """ Pickling for the program classes whose site files are parsed on the
+        executor. A process worker gets the parser settings and the data
+        server, not the fetcher (the file contents come with each task) or
+        the executor. """
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(fetcher=None, executor=None, _base=halocarbon_urls.basehttp)
+        return state
+
+    def __setstate__(self, state):
+        base = state.pop('_base')
+        # the worker may have been started before set_basehttp
+        if halocarbon_urls.basehttp != base:
+            halocarbon_urls.set_basehttp(base)
+        self.__dict__.update(state)
+
+
+class insitu(Site_Parser, halocarbon_urls.insitu_URLs):
     """ Class for loading CATS data from the GML FTP server.
     """
 
-    def __init__(self, verbose=True, prog='CATS'):
+    def __init__(self, verbose=True, prog='CATS', fetcher=None, rows=None, sites=None, start=None, end=None,
+                 executor=None):
         super().__init__(prog)
         self.verbose = verbose
-        self.mp_processes = 6
+        # only the files of these sites are read and rows outside the dates dropped
+        self.sites = subset_sites(self.sites, sites)
+        self.start, self.end = start, end
+        # concurrent downloads can't be too many or the server complains
+        self.fetcher = fetcher or Fetcher(concurrency=6)
+        self.rows = rows    # Rows_Cache, hourly files are parsed incrementally
+        # the site files are parsed on the executor
+        self.executor = executor or Executor('serial')
+
+    def source_urls(self, gas, freq='monthly'):
+        """ URLs of the files read for gas, one per site """
+        if gas not in self.gases:
+            return []
+        return [self.url(s, gas, freq) for s in self.sites]
 
-    def insitu_csv_reader(self, gas, freq, site):
+    def insitu_csv_reader(self, gas, freq, site, data=None):
+        """ Parse one site file. data is the file contents, if None the
+            file is downloaded. """
         try:
-            urls = self.urls(site, freq=freq)
-            url = urls[gas]
+            url = self.url(site, gas, freq)
         except KeyError:
             print(f'The insitu program does not report data for: {gas}')
             print(f'Choose from: {self.gases}')
@@ -378,16 +804,13 @@ class insitu(halocarbon_urls.insitu_URLs):
         if self.verbose:
             print(f'File URL: {url}')
 
+        buf = self.fetcher.open(url) if data is None else io.BytesIO(data)
+
         if freq == 'monthly':
-            df = pd.read_csv(url, sep='\s+', comment='#')            
+            df = pd.read_csv(buf, sep='\s+', comment='#')            
             col1, col2 = df.columns[:2]
             
-            df['date'] = pd.to_datetime(
-                df[col1].astype(str) +      # YYYY
-                df[col2].astype(str),       # MM
-                format='%Y%m',
-                errors='coerce'
-            )
+            df['date'] = assemble_dates(df[col1], df[col2])     # YYYY MM
             df.set_index('date', inplace=True)
             df.drop(columns=[col1, col2], inplace=True)  # drop the date columns
 
@@ -398,69 +821,160 @@ class insitu(halocarbon_urls.insitu_URLs):
                 df.columns = ['mf', 'unc', 'sd', 'n']                
 
         elif freq == 'daily':
-            df = pd.read_csv(url, sep='\s+', comment='#')            
+            df = pd.read_csv(buf, sep='\s+', comment='#')            
             col1, col2, col3 = df.columns[:3]
             
-            df['date'] = pd.to_datetime(
-                df[col1].astype(str) +      # YYYY
-                df[col2].astype(str) +      # MM
-                df[col3].astype(str),       # DD
-                format='%Y%m%d',
-                errors='coerce'
-            )
+            df['date'] = assemble_dates(df[col1], df[col2], df[col3])   # YYYY MM DD
             df.set_index('date', inplace=True)
             df.drop(columns=[col1, col2, col3], inplace=True)  # drop the date columns
             df.columns = ['mf', 'unc', 'n']
 
 
         elif freq == 'hourly':
-            dtype = {
-                'year':   'Int64',
-                'month':  'Int64',
-                'day':    'Int64',
-                'hour':   'Int64',
-                'minute': 'Int64',
-                'mf':     'float64',
-                'unc':    'float64',
-            }
-            df = pd.read_csv(
-                url,
-                sep='\s+',
-                comment='#',
-                na_values=['Nan'],
-                header=1,
-                names=['year','month','day','hour','minute','mf','unc'],
-                dtype=dtype,
-                low_memory=False
-            )
-
-            df['date'] = pd.to_datetime(
-                df[['year','month','day','hour','minute']]
-            )
-
-            df.set_index('date', inplace=True)
-            df = df[['mf','unc']]            # keep only your data columns
+            if self.rows is not None and data is not None:
+                df = self.rows.get(url, data, self.hourly_reader)
+            else:
+                df = self.hourly_reader(buf)
 
+        df = in_range(df, self.start, self.end)
         df['site'] = site       # add site column
 
         return df
 
+    def hourly_reader(self, buf, header=1, chunksize=None):
+        """ Parse an hourly file. header=None parses lines from the middle of
+            the file (no header lines). With chunksize an iterator of frames
+            of at most chunksize rows is returned. """
+        # the date parts go straight to assemble_dates, plain floats avoid
+        # the nullable integer columns
+        dtype = {
+            'year':   'float64',
+            'month':  'float64',
+            'day':    'float64',
+            'hour':   'float64',
+            'minute': 'float64',
+            'mf':     'float64',
+            'unc':    'float64',
+        }
+        reader = pd.read_csv(
+            buf,
+            sep='\s+',
+            comment='#',
+            na_values=['Nan'],
+            header=header,
+            names=['year','month','day','hour','minute','mf','unc'],
+            dtype=dtype,
+            low_memory=False,
+            chunksize=chunksize
+        )
+        if chunksize is not None:
+            return (self._hourly_frame(df) for df in reader)
+        return self._hourly_frame(reader)
+
+    def _hourly_frame(self, df):
+        df['date'] = assemble_dates(df['year'], df['month'], df['day'], df['hour'], df['minute'])
+
+        df.set_index('date', inplace=True)
+        return df[['mf','unc']]            # keep only your data columns
+
+    def iter_hourly(self, gas, by_year=False, chunksize=None, parse_rows=PARSE_ROWS):
+        """ Yield the hourly data for gas one piece at a time instead of
+            loading every site at once. Each piece is a date indexed frame
+            with a site column, one per site, or one per site and year with
+            by_year, or at most chunksize rows. Files are parsed parse_rows
+            lines at a time and only the next site's file is downloaded
+            while a site is parsed, so memory use is bounded by the bytes of
+            two files (the one being parsed and the next one), a parse_rows
+            chunk and one piece. """
+        if gas not in self.gases:
+            print(f'{self.prog} does not measure {gas}')
+            print(f'Choose from: {self.gases}')
+            return
+
+        urls = self.source_urls(gas, 'hourly')
+        if not urls:
+            return
+        with concurrent.futures.ThreadPoolExecutor(1) as ex:
+            download = ex.submit(self.fetcher.get, urls[0], append=True)
+            for i, site in enumerate(self.sites):
+                data = download.result()
+                if i + 1 < len(urls):
+                    download = ex.submit(self.fetcher.get, urls[i + 1], append=True)
+                if self.verbose:
+                    print(f'File URL: {urls[i]}')
+
+                frames = self.hourly_reader(io.BytesIO(data), chunksize=chunksize or parse_rows)
+                del data
+                for df in self._regroup(frames, by_year, chunksize):
+                    df = in_range(df, self.start, self.end)
+                    if df.shape[0] > 0:
+                        df['site'] = site
+                        yield df
+
+    def _regroup(self, frames, by_year, chunksize):
+        """ Parsed frames as pieces for iter_hourly. Rows are expected in time order. """
+        if chunksize:
+            yield from frames
+            return
+        if not by_year:
+            yield pd.concat(frames)
+            return
+
+        pending = []
+        for df in frames:
+            for year, part in df.groupby(df.index.year, sort=False):
+                if pending and pending[0].index[0].year != year:
+                    yield pd.concat(pending)
+                    pending = []
+                pending.append(part)
+        if pending:
+            yield pd.concat(pending)
+
+    def reduce_hourly(self, chunks, freq='monthly'):
+        """ Daily or monthly mean, sd and n of mf from the pieces yielded by
+            iter_hourly, accumulated one piece at a time. A month or day split
+            across pieces is combined from running sums. """
+        periods = {'daily': 'D', 'monthly': 'M'}
+        sums = []
+        for df in chunks:
+            mf = df['mf']
+            date = df.index.to_period(periods[freq]).to_timestamp()
+            part = pd.DataFrame({'s': mf, 'ss': mf * mf, 'n': mf.notna().astype('int64')})
+            sums.append(part.groupby([df['site'].to_numpy(), date]).sum())
+
+        if not sums:
+            return pd.DataFrame(columns=['mf', 'sd', 'n'])
+        tot = pd.concat(sums).groupby(level=[0, 1]).sum()
+        tot.index.names = ['site', 'date']
+
+        df = pd.DataFrame(index=tot.index)
+        n = tot['n'].where(tot['n'] > 0)
+        df['mf'] = tot['s'] / n
+        df['sd'] = np.sqrt(((tot['ss'] - tot['s'] * df['mf']) / (n - 1)).clip(lower=0))
+        df['n'] = tot['n']
+        return df
+
     def insitu_loader(self, gas, freq='monthly', gapfill=False):
-        """ Load CATS or RITS data for all sites. This method uses
-            multiprocessing to simultaneously load files from the FTP site. """
+        """ Load CATS or RITS data for all sites. The site files are
+            downloaded concurrently then parsed. """
 
         if gas not in self.gases:
             print(f'{self.prog} does not measure {gas}')
             print(f'Choose from: {self.gases}')
             return pd.DataFrame()
 
+        if len(self.sites) == 0:
+            print(f'{self.prog} has no data for the selected sites')
+            return pd.DataFrame()
+
         if self.verbose:
             print(f'Loading data for {gas}')
 
-        # processes can't be too large or ftp server complains
-        with mp.Pool(processes=self.mp_processes) as p:
-            # step through each insitu site.
-            res = p.starmap(self.insitu_csv_reader, [(gas, freq, s) for s in self.sites])
+        # download every site file at once then parse them
+        # hourly files only grow at the end
+        data = self.fetcher.get_many(self.source_urls(gas, freq), append=(freq == 'hourly'))
+        res = self.executor.starmap(self.insitu_csv_reader,
+                                    [(gas, freq, s, d) for s, d in zip(self.sites, data)])
 
         # create a single dataframe
         df = pd.concat(res)
@@ -486,33 +1000,44 @@ class insitu(halocarbon_urls.insitu_URLs):
         return df
 
 
-class Flasks(halocarbon_urls.Flask_GCECD_URLs):
+class Flasks(Site_Parser, halocarbon_urls.Flask_GCECD_URLs):
     """ Class for loading Flask data from the GML FTP server.
         More info about the flask program can be found here:
         https://gml.noaa.gov/hats/flask/flasks.html """
 
-    def __init__(self, verbose=True, prog='fECD'):
+    def __init__(self, verbose=True, prog='fECD', fetcher=None, sites=None, start=None, end=None,
+                 executor=None):
         super().__init__(prog)
         self.verbose = verbose
-        self.mp_processes = 6       # number of processors to use for FTP download
+        # only the files of these sites are read and rows outside the dates dropped
+        self.sites = subset_sites(self.sites, sites)
+        self.start, self.end = start, end
+        # concurrent downloads can't be too many or the server complains
+        self.fetcher = fetcher or Fetcher(concurrency=6)
+        # the site files are parsed on the executor
+        self.executor = executor or Executor('serial')
+
+    def source_urls(self, gas, freq='monthly'):
+        """ URLs of the files read for gas, one per site """
+        if gas not in self.gases:
+            return []
+        return [self.url(s, gas, freq) for s in self.sites]
 
-    def flask_csv_reader(self, gas, freq, site):
-        urls = self.urls(site, freq=freq)
-        url = urls[gas]
+    def flask_csv_reader(self, gas, freq, site, data=None):
+        """ Parse one site file. data is the file contents, if None the
+            file is downloaded. """
+        url = self.url(site, gas, freq)
 
         if self.verbose:
             print(f'{self.prog} file URL: {url}')
 
+        buf = self.fetcher.open(url) if data is None else io.BytesIO(data)
+
         if freq == 'monthly':
-            df = pd.read_csv(url, sep='\s+', comment='#')
+            df = pd.read_csv(buf, sep='\s+', comment='#')
             col1, col2 = df.columns[:2]
             
-            df['date'] = pd.to_datetime(
-                df[col1].astype(str) +      # YYYY
-                df[col2].astype(str),       # MM
-                format='%Y%m',
-                errors='coerce'
-            )
+            df['date'] = assemble_dates(df[col1], df[col2])     # YYYY MM
             df.set_index('date', inplace=True)
             df.drop(columns=[col1, col2], inplace=True)  # drop the date columns
             
@@ -522,18 +1047,11 @@ class Flasks(halocarbon_urls.Flask_GCECD_URLs):
                 df.columns = ['mf', 'sd', 'n']
 
         elif freq == 'pairs':
-            df = pd.read_csv(url, sep='\s+', comment='#')
+            df = pd.read_csv(buf, sep='\s+', comment='#')
 
             col1, col2, col3, col4, col5 = df.columns[:5]
-            df['date'] = pd.to_datetime(
-                df[col1].astype(str) +      # YYYY
-                df[col2].astype(str) +      # MM
-                df[col3].astype(str) +      # DD
-                df[col4].astype(str) +      # HH
-                df[col5].astype(str),       # MM
-                format='%Y%m%d%H%M',
-                errors='coerce'
-            )
+            # YYYY MM DD HH MM
+            df['date'] = assemble_dates(df[col1], df[col2], df[col3], df[col4], df[col5])
             df.set_index('date', inplace=True)
             df.drop(columns=[col1, col2, col3, col4, col5], inplace=True)  # drop the date columns
 
@@ -543,26 +1061,31 @@ class Flasks(halocarbon_urls.Flask_GCECD_URLs):
                 df.columns = ['mf', 'sd', 'n']
 
 
+        df = in_range(df, self.start, self.end)
         df['site'] = site       # add site column
 
         return df
 
     def flask_loader(self, gas, freq='monthly'):
-        """ Load Otto or OldGC data for all sites. This method uses
-            multiprocessing to simultaneously load files from the FTP site. """
+        """ Load Otto, fECD or OldGC data for all sites. The site files are
+            downloaded concurrently then parsed. """
 
         if gas not in self.gases:
             print(f'{self.prog} does not measure {gas}')
             print(f'Choose from: {self.gases}')
             return pd.DataFrame()
 
+        if len(self.sites) == 0:
+            print(f'{self.prog} has no data for the selected sites')
+            return pd.DataFrame()
+
         if self.verbose:
             print(f'Loading data for {gas}')
 
-        # processes can't be too large or ftp server complains
-        with mp.Pool(processes=self.mp_processes) as p:
-            # step through each insitu site.
-            res = p.starmap(self.flask_csv_reader, [(gas, freq, s) for s in self.sites])
+        # download every site file at once then parse them
+        data = self.fetcher.get_many(self.source_urls(gas, freq))
+        res = self.executor.starmap(self.flask_csv_reader,
+                                    [(gas, freq, s, d) for s, d in zip(self.sites, data)])
 
         # for each sub-DataFrame, drop any column that is 100% NaN
         cleaned = [df_.dropna(axis=1, how='all') for df_ in res]
@@ -582,9 +1105,16 @@ class Flasks(halocarbon_urls.Flask_GCECD_URLs):
 
 class Combined(halocarbon_urls.Combined_Data_URLs):
 
-    def __init__(self, verbose=True):
+    def __init__(self, verbose=True, fetcher=None, start=None, end=None):
         super().__init__()
         self.verbose = verbose
+        self.fetcher = fetcher or Fetcher()
+        # rows outside the dates are dropped while parsing
+        self.start, self.end = start, end
+
+    def source_urls(self, gas, freq='monthly'):
+        """ URLs of the files read for gas """
+        return [self.urls[gas]] if gas in self.urls else []
 
     def combo_loader(self, gas):
         filename = self.urls[gas]
@@ -594,18 +1124,9 @@ class Combined(halocarbon_urls.Combined_Data_URLs):
             print(f'File URL: {filename}')
             print('Please consult the header in the file listed above for PI and contact information.')
 
-        df = pd.read_csv(filename, sep='\s+', comment='#')
-
-        col1, col2 = df.columns[:2]
-        # convert the first two columns to a datetime index
-        df['date'] = pd.to_datetime(
-            df[col1].astype(str) +      # YYYY
-            df[col2].astype(str),       # MM
-            format='%Y%m',
-            errors='coerce'
-        )
-        df.set_index('date', inplace=True)
-        df.drop(columns=[col1, col2], inplace=True)  # drop the date columns
+        # parse a chunk at a time and keep only the rows between start and end
+        reader = pd.read_csv(self.fetcher.open(filename), sep='\s+', comment='#', chunksize=PARSE_ROWS)
+        df = pd.concat([in_range(self._dated(chunk), self.start, self.end) for chunk in reader])
 
         # shorten column names
         df.columns = [x.replace('HATS_', '') for x in df.columns]
@@ -619,3 +1140,30 @@ class Combined(halocarbon_urls.Combined_Data_URLs):
         self.sites = ['alt', 'sum', 'brw', 'cgo', 'kum', 'mhd', 'mlo', 'nwr', 'thd', 'smo', 'ush', 'psa', 'spo']
 
         return df
+
+    def _dated(self, df):
+        col1, col2 = df.columns[:2]
+        # convert the first two columns to a datetime index
+        df['date'] = assemble_dates(df[col1], df[col2])     # YYYY MM
+        df.set_index('date', inplace=True)
+        df.drop(columns=[col1, col2], inplace=True)  # drop the date columns
+        return df
+
+
+def main(argv=None):
+    """ Command line entry point, python -m halocarbons_loader export ...
+        (see halocarbons_export). """
+    import argparse
+    import halocarbons_export
+
+    parser = argparse.ArgumentParser(prog='python -m halocarbons_loader',
+                                     description='NOAA/GML HATS data loader.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    halocarbons_export.add_arguments(commands.add_parser('export', help='export data to Parquet, CSV or netCDF files'))
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
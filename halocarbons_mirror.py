@@ -0,0 +1,197 @@
+#! /usr/bin/env python
+
+""" Local mirror of the HATS data tree, for machines without outbound access.
+
+    Every url that halocarbon_urls can generate is downloaded into a directory
+    with the same layout as the server and manifest.json lists the size,
+    sha256 and ETag / Last-Modified of each file. Files the server does not
+    have are listed as missing. Running it again only downloads the files
+    that changed on the server. catalog.json is the url catalog (see
+    halocarbon_urls.URL_Catalog) with the availability of every file.
+
+    To load data from the mirror without any network calls:
+
+        halocarbon_urls.set_basehttp('/path/to/mirror')
+        hats = halocarbons_loader.HATS_Loader()
+
+    Command line:
+
+        python halocarbons_mirror.py /path/to/mirror
+        python halocarbons_mirror.py /path/to/mirror --verify
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import urllib.error
+from datetime import datetime, timezone
+
+import halocarbon_urls
+from halocarbons_cache import header
+from halocarbons_fetch import Fetcher, local_path
+
+MANIFEST = 'manifest.json'
+CATALOG = 'catalog.json'
+
+
+def write_file(path, data):
+    """ Write to a temporary file then rename it so a partial file is never
+        left in the mirror. """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+
+
+class Mirror:
+
+    def __init__(self, mirror_dir, concurrency=6, verbose=True):
+        """ mirror_dir  : local copy of the data tree, created if needed
+            concurrency : number of downloads at once """
+        self.mirror_dir = os.path.abspath(os.path.expanduser(mirror_dir))
+        self.fetcher = Fetcher(concurrency=concurrency)
+        self.verbose = verbose
+
+    def _path(self, rel):
+        return os.path.join(self.mirror_dir, *rel.split('/'))
+
+    def manifest(self):
+        """ The current manifest, empty if the mirror has not been made yet. """
+        try:
+            with open(os.path.join(self.mirror_dir, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'files': {}, 'missing': []}
+
+    def _fetch(self, url, rel, old):
+        """ Download url into the mirror unless the server reports the mirrored
+            copy is current. Returns the manifest entry for the file or None
+            if the server does not have it. """
+        path = self._path(rel)
+        headers = {}
+        if old is not None and os.path.exists(path):
+            if old.get('etag'):
+                headers['If-None-Match'] = old['etag']
+            if old.get('last_modified'):
+                headers['If-Modified-Since'] = old['last_modified']
+
+        try:
+            status, rheaders, body = self.fetcher.pool.request(url, headers)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        if status == 304:
+            return old
+
+        write_file(path, body)
+        return {
+            'size': len(body),
+            'sha256': hashlib.sha256(body).hexdigest(),
+            'etag': header(rheaders, 'ETag'),
+            'last_modified': header(rheaders, 'Last-Modified'),
+        }
+
+    def update(self, urls=None):
+        """ Download every url (default all of halocarbon_urls.all_urls) from
+            the server halocarbon_urls.basehttp points at and write the
+            manifest. Returns the manifest. """
+        base = halocarbon_urls.basehttp
+        if local_path(base) is not None:
+            raise ValueError(f'basehttp is a local directory ({base}), set it to the server to mirror.')
+
+        urls = halocarbon_urls.all_urls() if urls is None else urls
+        rels = [url[len(base) + 1:] for url in urls]
+        old = self.manifest()['files']
+
+        if self.verbose:
+            print(f'Mirroring {len(urls)} files from {base} to {self.mirror_dir}')
+        res = self.fetcher.map(lambda item: self._fetch(item[0], item[1], old.get(item[1])),
+                               list(zip(urls, rels)), return_exceptions=True)
+
+        files, missing, failed = {}, [], {}
+        for rel, r in zip(rels, res):
+            if isinstance(r, Exception):
+                failed[rel] = str(r)
+                # keep the copy from the last run
+                if rel in old:
+                    files[rel] = old[rel]
+            elif r is None:
+                missing.append(rel)
+                # removed from the server
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._path(rel))
+            else:
+                files[rel] = r
+
+        manifest = {
+            'base': base,
+            'updated': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'files': files,
+            'missing': missing,
+            'failed': failed,
+        }
+        write_file(os.path.join(self.mirror_dir, MANIFEST),
+                   json.dumps(manifest, indent=1, sort_keys=True).encode())
+        # the url catalog with what the server has, to load with use_catalog
+        catalog = halocarbon_urls.catalog()
+        catalog.update_status(manifest)
+        write_file(os.path.join(self.mirror_dir, CATALOG), catalog.to_json().encode())
+
+        if self.verbose:
+            print(f'{len(files)} files, {sum(f["size"] for f in files.values())} bytes, '
+                  f'{len(missing)} not on the server, {len(failed)} failed')
+            for rel, err in failed.items():
+                print(f'Failed: {rel} ({err})')
+        return manifest
+
+    def verify(self):
+        """ Check the size and sha256 of every file in the manifest. Returns
+            the files that are missing or do not match. """
+        bad = []
+        for rel, entry in self.manifest()['files'].items():
+            try:
+                with open(self._path(rel), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                bad.append(rel)
+                continue
+            if len(data) != entry['size'] or hashlib.sha256(data).hexdigest() != entry['sha256']:
+                bad.append(rel)
+
+        if self.verbose:
+            for rel in bad:
+                print(f'Does not match the manifest: {rel}')
+        return bad
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mirror the NOAA/GML HATS data files to a local directory.')
+    parser.add_argument('mirror_dir', help='local directory for the mirror')
+    parser.add_argument('--base', help='server to mirror, default is halocarbon_urls.basehttp')
+    parser.add_argument('--jobs', '-j', type=int, default=6, help='concurrent downloads')
+    parser.add_argument('--verify', action='store_true', help='check the mirrored files against the manifest')
+    parser.add_argument('--quiet', '-q', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.base:
+        halocarbon_urls.set_basehttp(args.base)
+    mirror = Mirror(args.mirror_dir, concurrency=args.jobs, verbose=not args.quiet)
+
+    if args.verify:
+        return 1 if mirror.verify() else 0
+    return 1 if mirror.update()['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
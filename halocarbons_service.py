@@ -0,0 +1,268 @@
+#! /usr/bin/env python
+
+""" Local HTTP service that keeps loaded HATS data in memory.
+
+    HATS_Service owns one HATS_Loader and keeps the frames it loads in a
+    least recently used cache bounded in bytes. Requests for the same
+    (gas, program, freq, gapfill) that arrive while it is loading wait for
+    that load instead of starting their own, so the data server sees one
+    request per file. Loads of different keys run at the same time on the
+    shared loader: each load makes its own program class and the file,
+    results, rows and model caches write through temporary files, as when
+    several export jobs share a cache directory. Every request is answered with a slice of the cached
+    frame by site and date range, as JSON, CSV or Arrow (requires pyarrow).
+
+        python halocarbons_service.py --port 8765 --cache-dir ~/.cache/hats
+
+        GET /data?gas=F11&program=cats&freq=monthly&sites=brw,mlo&start=2015-01-01&format=json
+        GET /gases
+        GET /stats
+
+    query() reads /data back into a loader style DataFrame:
+
+        df = query('http://127.0.0.1:8765', 'F11', program='cats', sites=['brw'])
+"""
+
+import io
+import sys
+import json
+import argparse
+import threading
+import collections
+import urllib.parse
+import urllib.request
+import concurrent.futures
+import http.server
+
+import pandas as pd
+
+import halocarbon_urls
+from halocarbons_loader import HATS_Loader, GAPFILL_METHODS, in_range
+
+FORMATS = ('json', 'csv', 'arrow')
+FREQS = ('monthly', 'daily', 'hourly', 'pairs')
+MAX_BYTES = 1024 ** 3
+
+
+class HATS_Service:
+
+    def __init__(self, hats=None, max_bytes=MAX_BYTES, compact=True):
+        """ hats      : the HATS_Loader to load with, default a new one
+            max_bytes : memory limit of the cached frames, the least recently
+                        used frames are dropped past it
+            compact   : load with compact=True (see compact_frame) so more
+                        frames fit in max_bytes """
+        self.hats = hats or HATS_Loader()
+        self.max_bytes = max_bytes
+        self.compact = compact
+        self.frames = collections.OrderedDict()     # key: (df, bytes)
+        self.nbytes = 0
+        self.hits = self.misses = self.waits = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def key(self, gas, program='msd', freq='monthly', gapfill=False):
+        """ Cache key of a frame, with the gas name resolved. Raises KeyError
+            for a gas that is not measured and ValueError for an unknown
+            program, freq or gapfill method. """
+        program, freq = program.lower(), freq.lower()
+        hats = self.hats
+        programs = hats.programs_msd + hats.programs_insitu + hats.programs_flaskECD + hats.programs_combined
+        if program not in programs:
+            raise ValueError(f'Unknown program={program}, choose from {programs}')
+        if freq not in FREQS:
+            raise ValueError(f'Unknown freq={freq}, choose from {FREQS}')
+        if isinstance(gapfill, str) and gapfill not in GAPFILL_METHODS:
+            raise ValueError(f'Unknown gapfill={gapfill}, choose from {GAPFILL_METHODS}')
+        proper = halocarbon_urls.catalog().resolve(gas)
+        if proper is None:
+            raise KeyError(f'NOAA/GML does not measure {gas}')
+        return proper, program, freq, gapfill
+
+    def frame(self, gas, program='msd', freq='monthly', gapfill=False):
+        """ The full frame of all sites and dates, from the cache or loaded
+            once however many requests ask for it at the same time. Raises
+            KeyError when there is no data. """
+        key = self.key(gas, program, freq, gapfill)
+        with self._lock:
+            if key in self.frames:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return self.frames[key][0]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = concurrent.futures.Future()
+                self.misses += 1
+            else:
+                self.waits += 1
+        if not owner:
+            return future.result()
+
+        try:
+            df = self.hats.loader(*key, verbose=False, compact=self.compact)
+            if df is None or df.shape[0] == 0:
+                raise KeyError(f'No {key[2]} {key[0]} data for the {key[1]} program')
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._store(key, df)
+            del self._inflight[key]
+        future.set_result(df)
+        return df
+
+    def _store(self, key, df):
+        nbytes = int(df.memory_usage(deep=True).sum())
+        self.frames[key] = (df, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes and len(self.frames) > 1:
+            _, (_, dropped) = self.frames.popitem(last=False)
+            self.nbytes -= dropped
+
+    def query(self, gas, program='msd', freq='monthly', gapfill=False, sites=None, start=None, end=None):
+        """ Rows of the frame for sites (a list of site codes in any case, all
+            by default) dated from start to end inclusive. """
+        df = self.frame(gas, program, freq, gapfill)
+        if sites and 'site' in df.index.names:
+            df = df[df.index.get_level_values('site').isin([s.lower() for s in sites])]
+        return in_range(df, start, end)
+
+    def stats(self):
+        with self._lock:
+            return {'frames': len(self.frames), 'bytes': self.nbytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'waits': self.waits,
+                    'loading': len(self._inflight),
+                    'cached': [list(map(str, k)) for k in self.frames]}
+
+    def clear(self):
+        """ Drop every cached frame. """
+        with self._lock:
+            self.frames.clear()
+            self.nbytes = 0
+
+    def server(self, host='127.0.0.1', port=8765):
+        """ ThreadingHTTPServer answering the requests with this service,
+            call serve_forever() on it. """
+        srv = http.server.ThreadingHTTPServer((host, port), Service_Handler)
+        srv.daemon_threads = True
+        srv.service = self
+        return srv
+
+
+def encode(df, fmt):
+    """ (content type, body) of df in one of FORMATS. """
+    df = df.reset_index()
+    if fmt == 'csv':
+        return 'text/csv', df.to_csv(index=False, date_format='%Y-%m-%dT%H:%M:%S').encode()
+    if fmt == 'arrow':
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return 'application/vnd.apache.arrow.stream', sink.getvalue().to_pybytes()
+    body = df.to_json(orient='split', index=False, date_format='iso', date_unit='s')
+    return 'application/json', body.encode()
+
+
+def parse_gapfill(value):
+    if value is None or value.lower() in ('', '0', 'false', 'no'):
+        return False
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    return value
+
+
+class Service_Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status, obj):
+        self._send(status, 'application/json', json.dumps(obj).encode())
+
+    def do_GET(self):
+        service = self.server.service
+        url = urllib.parse.urlsplit(self.path)
+        params = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+
+        if url.path == '/gases':
+            return self._json(200, halocarbon_urls.catalog().gases)
+        if url.path == '/stats':
+            return self._json(200, service.stats())
+        if url.path != '/data':
+            return self._json(404, {'error': f'Unknown path {url.path}, use /data, /gases or /stats'})
+
+        fmt = params.get('format', 'json')
+        if 'gas' not in params or fmt not in FORMATS:
+            return self._json(400, {'error': f'/data needs gas= and format one of {FORMATS}'})
+        sites = [s for s in params.get('sites', '').split(',') if s]
+        try:
+            df = service.query(params['gas'], params.get('program', 'msd'), params.get('freq', 'monthly'),
+                               parse_gapfill(params.get('gapfill')), sites=sites,
+                               start=params.get('start'), end=params.get('end'))
+            content_type, body = encode(df, fmt)
+        except KeyError as e:
+            return self._json(404, {'error': e.args[0] if e.args else str(e)})
+        except (ValueError, ImportError) as e:
+            return self._json(400, {'error': str(e)})
+        except Exception as e:
+            return self._json(502, {'error': f'{type(e).__name__}: {e}'})
+        self._send(200, content_type, body)
+
+
+def query(base, gas, program='msd', freq='monthly', gapfill=False, sites=None, start=None, end=None, timeout=600):
+    """ DataFrame of a HATS_Service /data request, indexed like the loader
+        frames. base is the service url, e.g. http://127.0.0.1:8765 """
+    params = {'gas': gas, 'program': program, 'freq': freq, 'gapfill': str(gapfill), 'format': 'json'}
+    if sites:
+        params['sites'] = ','.join(sites)
+    if start is not None:
+        params['start'] = str(start)
+    if end is not None:
+        params['end'] = str(end)
+    url = f'{base.rstrip("/")}/data?{urllib.parse.urlencode(params)}'
+    with urllib.request.urlopen(url, timeout=timeout) as r:
+        df = pd.read_json(io.BytesIO(r.read()), orient='split', convert_dates=['date'])
+    index = [c for c in ('site', 'date') if c in df.columns]
+    return df.set_index(index) if index else df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve HATS data from memory over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-dir', help='HATS_Loader file and results cache directory')
+    parser.add_argument('--base', help='data server or local mirror, default is halocarbon_urls.basehttp')
+    parser.add_argument('--max-mb', type=float, default=MAX_BYTES / 1024 ** 2, help='memory for cached frames')
+    args = parser.parse_args(argv)
+
+    if args.base:
+        halocarbon_urls.set_basehttp(args.base)
+    service = HATS_Service(HATS_Loader(cache_dir=args.cache_dir), max_bytes=int(args.max_mb * 1024 ** 2))
+    srv = service.server(args.host, args.port)
+    print(f'Serving HATS data on http://{args.host}:{srv.server_port}')
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        service.hats.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import os
+import re
+import sys
+import threading
+import http.server
+
+import pytest
+
+# the modules are at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+class Stub_Handler(http.server.BaseHTTPRequestHandler):
+    """ Serves server.files ({path: (body, etag)}) with ETag revalidation and,
+        when server.ranges is set, single byte range requests, with the ETag
+        header named server.etag_header. Every response status is appended to
+        server.log as (path, status). """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.server.log.append((self.path, status))
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path not in self.server.files:
+            return self._send(404)
+        body, etag = self.server.files[self.path]
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, headers={self.server.etag_header: etag})
+
+        m = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+        if m and self.server.ranges:
+            start = int(m[1])
+            end = int(m[2]) if m[2] else len(body) - 1
+            if start >= len(body):
+                return self._send(416, headers={'Content-Range': f'bytes */{len(body)}'})
+            end = min(end, len(body) - 1)
+            return self._send(206, body[start:end + 1],
+                              {self.server.etag_header: etag, 'Content-Range': f'bytes {start}-{end}/{len(body)}'})
+        self._send(200, body, {self.server.etag_header: etag})
+
+
+@pytest.fixture
+def stub():
+    """ Local HTTP server, set stub.files[path] = (body, etag) to serve a file. """
+    srv = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Stub_Handler)
+    srv.daemon_threads = True
+    srv.files = {}
+    srv.ranges = True
+    srv.etag_header = 'ETag'
+    srv.log = []
+    srv.base = f'http://127.0.0.1:{srv.server_port}'
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def stub_base(stub):
+    """ The stub as the data server of the URL classes. """
+    import halocarbon_urls
+    old = halocarbon_urls.basehttp
+    halocarbon_urls.set_basehttp(stub.base)
+    yield stub
+    halocarbon_urls.set_basehttp(old)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from halocarbons_loader import HATS_Loader, site_table
+
+
+def per_row_lookup(df_org):
+    """ add_location before the distinct site lookup: a merge of every row
+        against the site table. """
+    return (
+        df_org
+        .copy()
+        .reset_index()
+        .assign(site_lookup=lambda d: d['site'].str.replace('_pfp$', '', regex=True).str.upper())
+        .merge(site_table().reset_index().rename(columns={'site': 'site_lookup'}), on='site_lookup', how='left')
+        .drop(columns=['site_lookup'])
+        .set_index(['site', 'date'])
+    )
+
+
+@pytest.fixture
+def frame():
+    # known sites, a _pfp site, an unknown code, the sites out of order and
+    # of different lengths
+    dates = pd.date_range('2020-01-01', periods=24, freq='MS')
+    index = pd.MultiIndex.from_tuples([(s, d) for s, n in [('spo', 24), ('brw', 12), ('mlo_pfp', 24), ('xyz', 6), ('nwr', 18)]
+                                       for d in dates[:n]], names=['site', 'date'])
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({'mf': rng.normal(240, 1, len(index)), 'sd': rng.uniform(0, 1, len(index))}, index=index)
+
+
+def test_same_frame_as_the_per_row_lookup(frame):
+    df = HATS_Loader().add_location(frame)
+    expected = per_row_lookup(frame)
+    pd.testing.assert_frame_equal(df, expected)
+
+    assert df.loc['xyz', ['name', 'lat', 'lon', 'elev']].isna().all().all()
+    assert (df.loc['mlo_pfp', 'lat'] == site_table().loc['MLO', 'lat']).all()
+    # the measurements are not touched
+    pd.testing.assert_frame_equal(df[['mf', 'sd']], frame)
+
+
+def test_sorted_and_filtered_frames(frame):
+    hats = HATS_Loader()
+    for sub in (frame.sort_index(), frame.loc[['xyz', 'nwr']], frame.iloc[::5]):
+        pd.testing.assert_frame_equal(hats.add_location(sub), per_row_lookup(sub))
@@ -0,0 +1,112 @@
+import io
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from halocarbons_cache import HTTP_Cache, Rows_Cache
+from halocarbons_loader import HATS_Loader, insitu
+
+PATH = '/cfcs/cfc11/insituGCs/CATS/hourly/brw_F11_All.dat'
+HEADER = b'# CATS hourly data\nCATS F11 brw\nyyyy mm dd hh mn mf unc\n'
+
+
+def hourly_lines(first_day, days, mf=240.0):
+    return b''.join(f'2001 3 {d} {h} 0 {mf + h / 10:.1f} 0.5\n'.encode()
+                    for d in range(first_day, first_day + days) for h in range(24))
+
+
+def load(hats):
+    return hats.loader('F11', 'cats', 'hourly', sites=['brw'], addlocation=False, verbose=False)
+
+
+@pytest.fixture
+def hats(stub_base, tmp_path):
+    hats = HATS_Loader(cache_dir=tmp_path)
+    hats.cache.max_age = 0
+    yield hats
+    hats.close()
+
+
+def test_append_downloads_and_parses_only_the_new_rows(stub_base, hats):
+    stub_base.files[PATH] = (HEADER + hourly_lines(1, 10), '"v1"')
+    assert len(load(hats)) == 10 * 24
+
+    stub_base.files[PATH] = (HEADER + hourly_lines(1, 12), '"v2"')
+    df = load(hats)
+    assert len(df) == 12 * 24
+    assert (PATH, 206) in stub_base.log
+    assert hats.cache.appended == 1
+    assert hats.rows.appended == 1
+
+
+def test_append_without_range_support_downloads_the_whole_file(stub_base, hats):
+    stub_base.ranges = False
+    stub_base.files[PATH] = (HEADER + hourly_lines(1, 10), '"v1"')
+    load(hats)
+
+    stub_base.files[PATH] = (HEADER + hourly_lines(1, 12), '"v2"')
+    df = load(hats)
+    assert len(df) == 12 * 24
+    assert (PATH, 206) not in stub_base.log
+    assert (hats.cache.appended, hats.cache.downloads) == (0, 2)
+    # the cached rows are still a prefix of the new file
+    assert hats.rows.appended == 1
+
+
+def test_change_in_the_middle_is_downloaded_and_parsed_again(stub_base, hats):
+    stub_base.files[PATH] = (HEADER + hourly_lines(1, 28), '"v1"')
+    load(hats)
+    del stub_base.log[:]
+
+    # day 15, past the header bytes that are compared, is revised with
+    # longer values and two days are appended
+    body = HEADER + hourly_lines(1, 14) + hourly_lines(15, 1, mf=1240.0) + hourly_lines(16, 15)
+    stub_base.files[PATH] = (body, '"v2"')
+    df = load(hats)
+    # the tail did not match, the Range response is dropped for the whole file
+    assert [status for _, status in stub_base.log][:2] == [206, 200]
+    assert (hats.cache.appended, hats.cache.downloads) == (0, 2)
+    assert hats.rows.appended == 0
+    assert len(df) == 30 * 24
+    assert df.loc[('brw', '2001-03-15 00:00'), 'mf'] == 1240.0
+    assert df.loc[('brw', '2001-03-14 00:00'), 'mf'] == 240.0
+
+
+def test_rows_cache_parses_in_full_when_stored_bytes_changed(tmp_path):
+    parser = insitu(verbose=False)
+    calls = []
+
+    def parse(buf, header=1):
+        calls.append(header)
+        return parser.hourly_reader(buf, header=header)
+
+    rows = Rows_Cache(tmp_path)
+    url = f'http://example.invalid{PATH}'
+    old = HEADER + hourly_lines(1, 10)
+    rows.get(url, old, parse)
+
+    # same length, so only the sha256 of the stored bytes tells them apart
+    new = old.replace(b'2001 3 5 0 0 240.0', b'2001 3 5 0 0 241.0') + hourly_lines(11, 1)
+    df = rows.get(url, new, parse)
+    assert calls == [1, 1]
+    assert rows.appended == 0
+    expected = parser.hourly_reader(io.BytesIO(new))
+    pd.testing.assert_frame_equal(df, expected)
+
+    # appending to it parses only the new lines
+    rows.get(url, new + hourly_lines(12, 1), parse)
+    assert calls == [1, 1, None]
+    assert rows.appended == 1
+
+
+def test_shorter_file_is_downloaded_in_full(stub, tmp_path):
+    stub.files['/f.dat'] = (HEADER + hourly_lines(1, 10), '"v1"')
+    cache = HTTP_Cache(tmp_path, max_age=0)
+    cache.get(f'{stub.base}/f.dat', append=True)
+
+    stub.files['/f.dat'] = (HEADER + hourly_lines(1, 2), '"v2"')
+    assert cache.get(f'{stub.base}/f.dat', append=True) == HEADER + hourly_lines(1, 2)
+    assert ('/f.dat', 416) in stub.log
+    assert (cache.appended, cache.downloads) == (0, 2)
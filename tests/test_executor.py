@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from halocarbons_executor import Executor
+from halocarbons_loader import HATS_Loader
+
+SITES = ('brw', 'nwr', 'mlo', 'smo', 'spo', 'sum')
+
+
+def serve_cats(stub):
+    for k, site in enumerate(SITES):
+        lines = ['# CATS F11 monthly', 'yyyy mm mf sd n']
+        lines += [f'{y} {m} {240 + k + m / 10:.1f} 0.5 20' for y in range(2000, 2005) for m in range(1, 13)]
+        stub.files[f'/cfcs/cfc11/insituGCs/CATS/monthly/{site}_F11_MM.dat'] = (('\n'.join(lines) + '\n').encode(), '"v1"')
+
+
+@pytest.mark.parametrize('kind, start_method', [('serial', None), ('process', 'spawn'), ('process', 'fork')])
+def test_executors_parse_the_same_frame(stub_base, kind, start_method):
+    serve_cats(stub_base)
+    reference = HATS_Loader(executor=Executor('thread', workers=2))
+    hats = HATS_Loader(executor=Executor(kind, workers=2, start_method=start_method))
+    try:
+        expected = reference.loader('F11', 'cats', verbose=False)
+        df = hats.loader('F11', 'cats', verbose=False)
+        many = hats.load_many('F11', programs='cats', progress=False)
+    finally:
+        reference.close()
+        hats.close()
+    assert len(expected) == 6 * 60
+    pd.testing.assert_frame_equal(df, expected)
+    pd.testing.assert_frame_equal(many[('F11', 'cats')], expected)
+
+
+def test_process_workers_follow_the_data_server(stub, tmp_path):
+    # a fork pool started before set_basehttp still parses the later urls
+    import halocarbon_urls
+    hats = HATS_Loader(executor=Executor('process', workers=2, start_method='fork'))
+    hats.executor.map(abs, [1, 2])
+    old = halocarbon_urls.basehttp
+    halocarbon_urls.set_basehttp(stub.base)
+    try:
+        serve_cats(stub)
+        df = hats.loader('F11', 'cats', verbose=False)
+    finally:
+        halocarbon_urls.set_basehttp(old)
+        hats.close()
+    assert len(df) == 6 * 60
@@ -0,0 +1,60 @@
+import json
+
+import pandas as pd
+
+import halocarbons_export
+from halocarbons_export import export_path, main
+
+from test_executor import SITES, serve_cats
+
+
+def serve_daily(stub):
+    for k, site in enumerate(SITES):
+        lines = ['# CATS F11 daily', 'yyyy mm dd mf unc n']
+        lines += [f'2004 {m} {d} {240 + k + d / 100:.2f} 0.5 20' for m in range(1, 4) for d in range(1, 29)]
+        stub.files[f'/cfcs/cfc11/insituGCs/CATS/daily/{site}_F11_Day.dat'] = (('\n'.join(lines) + '\n').encode(), '"v1"')
+
+
+def test_cli_export(stub_base, tmp_path):
+    serve_cats(stub_base)
+    serve_daily(stub_base)
+    out = tmp_path / 'out'
+    status = main(['--gases', 'F11', 'SF6', '--programs', 'cats', '--freqs', 'monthly', 'daily', '--gapfill',
+                   '--format', 'csv', '--out', str(out), '--base', stub_base.base, '--cache-dir', str(tmp_path / 'cache'),
+                   '--sites', 'brw', 'mlo', '-q'])
+
+    # SF6 has no files on the stub server
+    assert status == 1
+    with open(out / 'export_summary.json') as f:
+        summary = json.load(f)
+    assert (summary['ok'], summary['failed']) == (2, 2)
+    jobs = {(j['gas'], j['freq']): j for j in summary['jobs']}
+    assert jobs[('SF6', 'monthly')]['status'] == 'failed'
+    assert 'SF6' in jobs[('SF6', 'monthly')]['error']
+
+    monthly = pd.read_csv(out / 'F11_cats_monthly_gf.csv')
+    assert jobs[('F11', 'monthly')]['file'] == str(out / 'F11_cats_monthly_gf.csv')
+    assert set(monthly['site']) == {'brw', 'mlo'}
+    assert 'mf_mod' in monthly.columns
+    # daily data is not gapfilled and has no _gf suffix
+    daily = pd.read_csv(out / 'F11_cats_daily.csv')
+    assert len(daily) == jobs[('F11', 'daily')]['rows'] == 2 * 3 * 28
+
+
+def test_gapfill_suffix_is_only_for_monthly_files():
+    assert export_path('out', 'F11', 'cats', 'monthly', True, 'csv').endswith('F11_cats_monthly_gf.csv')
+    assert export_path('out', 'F11', 'cats', 'monthly', 'harmonic', 'csv').endswith('F11_cats_monthly_gf-harmonic.csv')
+    for freq in ('daily', 'hourly', 'pairs'):
+        assert export_path('out', 'F11', 'cats', freq, True, 'netcdf').endswith(f'F11_cats_{freq}.nc')
+
+
+def test_netcdf_needs_an_engine(tmp_path, monkeypatch, capsys):
+    found = {'xarray'}
+    monkeypatch.setattr(halocarbons_export.importlib.util, 'find_spec', lambda name: name in found or None)
+    assert main(['--gases', 'F11', '--format', 'netcdf', '--out', str(tmp_path), '-q']) == 2
+    assert 'netCDF4 or scipy' in capsys.readouterr().out
+
+    # xarray with the scipy engine is enough, there are no jobs to run
+    found.add('scipy')
+    summary = halocarbons_export.export(['F11'], programs=(), fmt='netcdf', out_dir=str(tmp_path), verbose=False)
+    assert summary['jobs'] == []
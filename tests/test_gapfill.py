@@ -0,0 +1,119 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gapfill import Gap_Methods
+from halocarbons_loader import HATS_Loader
+
+NOISE = 0.3
+
+
+def network(sites=13, seed=3):
+    """ Monthly (site, date) frame of a trend, a seasonal cycle and noise,
+        each site with its own start and length and 10 % of months missing. """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for k in range(sites):
+        idx = pd.date_range('1995-01-01', periods=240 - 7 * k, freq='MS') + pd.DateOffset(months=3 * k)
+        t = np.arange(len(idx))
+        mf = 250 - 0.05 * t + 3 * np.sin(2 * np.pi * idx.month.to_numpy() / 12 + k) + rng.normal(0, NOISE, len(idx))
+        mf[rng.random(len(idx)) < 0.1] = np.nan
+        sd = rng.uniform(0.1, 0.5, len(idx))
+        sd[rng.random(len(idx)) < 0.2] = np.nan
+        frames.append(pd.DataFrame({'site': f's{k:02d}', 'date': idx, 'mf': mf, 'sd': sd}))
+    return pd.concat(frames).set_index(['site', 'date']).sort_index()
+
+
+def test_seasonal_sites_matches_statsmodels():
+    # tolerance: the batched fit is within half the noise of statsmodels at
+    # every date, forecast included, with an rms difference under a fifth of
+    # the noise; most sites agree to a few hundredths
+    pytest.importorskip('statsmodels')
+    df = network()
+    gap = Gap_Methods()
+    batched = gap.seasonal_sites(df, forecast_periods=12)
+    rms = []
+    for site in df.index.get_level_values(0).unique():
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            reference = gap.seasonal(df.loc[site], forecast_periods=12)
+        out = batched[site]
+        pd.testing.assert_index_equal(out.index, reference.index)
+        diff = (out['mf_mod'] - reference['mf_mod']).abs()
+        rms.append(np.sqrt((diff ** 2).mean()))
+        assert diff.max() < NOISE / 2, site
+        assert rms[-1] < NOISE / 5, site
+        # measured months are kept as they are
+        measured = reference['mf'].notna()
+        assert (out.loc[measured, 'mf_filled'] == reference.loc[measured, 'mf']).all()
+    assert np.median(rms) < NOISE / 30
+
+
+def test_linear_sites_matches_gapfill_site():
+    df = network()
+    gap = Gap_Methods()
+    batched = gap.linear_sites(df)
+    for site in df.index.get_level_values(0).unique():
+        reference = gap.linear(df.loc[site])
+        pd.testing.assert_series_equal(batched.loc[site, 'gf'], reference['gf'], check_names=False)
+        pd.testing.assert_series_equal(batched.loc[site, 'gfsd'], reference['gfsd'], check_names=False)
+
+    expected = pd.concat([HATS_Loader.gapfill_site(df.loc[s], s, 'linear')
+                          for s in df.index.get_level_values(0).unique()])
+    expected = expected.reset_index().set_index(['site', 'date']).sort_index()
+    pd.testing.assert_frame_equal(HATS_Loader.linear_gapfill(df), expected, check_exact=False, rtol=1e-12)
+
+
+def curve(months):
+    """ A cubic trend plus two annual harmonics, the harmonic() model itself. """
+    t = np.asarray(months) / 12
+    return (240 + 1.5 * t - 0.05 * t ** 2 + 0.001 * t ** 3
+            + 4 * np.sin(2 * np.pi * t) + 1.5 * np.cos(4 * np.pi * t + 0.3))
+
+
+def seasonal_series(months=180, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range('2000-01-01', periods=months, freq='MS')
+    truth = curve(np.arange(months))
+    return pd.Series(truth, index=idx), truth + rng.normal(0, noise, months)
+
+
+def test_harmonic_fills_the_gaps():
+    truth, mf = seasonal_series()
+    gaps = [5, 6, 7, 50, 100, 101, 150]
+    mf[gaps] = np.nan
+    df = pd.DataFrame({'mf': mf}, index=truth.index)
+    out = Gap_Methods().harmonic(df, smooth=0, forecast_periods=12)
+
+    assert len(out) == len(df) + 12
+    # the series is the model, so the gaps and the forecast are exact
+    filled = out['mf_filled'].iloc[gaps]
+    np.testing.assert_allclose(filled.to_numpy(), truth.iloc[gaps].to_numpy(), atol=1e-8)
+    np.testing.assert_allclose(out['mf_filled'].iloc[-12:].to_numpy(), curve(np.arange(180, 192)), atol=1e-6)
+    # observed values are unchanged
+    observed = ~np.isnan(mf)
+    assert (out['mf_filled'].to_numpy()[:180][observed] == mf[observed]).all()
+    assert out['mf'].iloc[gaps].isna().all()
+
+
+def test_harmonic_with_noise_and_smoothing():
+    truth, mf = seasonal_series(noise=NOISE, seed=1)
+    gaps = np.arange(30, 180, 9)
+    mf[gaps] = np.nan
+    df = pd.DataFrame({'mf': mf}, index=truth.index)
+    out = Gap_Methods().harmonic(df)
+
+    # the gaps are filled to within the noise of the true series
+    err = (out['mf_filled'].iloc[gaps] - truth.iloc[gaps]).abs()
+    assert err.max() < NOISE
+    observed = df['mf'].notna().to_numpy()
+    assert (out['mf_filled'].to_numpy()[observed] == mf[observed]).all()
+
+
+def test_harmonic_needs_two_cycles():
+    truth, mf = seasonal_series(months=20)
+    out = Gap_Methods().harmonic(pd.DataFrame({'mf': mf}, index=truth.index))
+    assert out['mf_mod'].isna().all()
+    assert (out['mf_filled'] == out['mf']).all()
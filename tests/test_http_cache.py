@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from halocarbons_cache import HTTP_Cache
+from halocarbons_fetch import Connection_Pool
+
+
+def test_not_modified_keeps_the_cached_body(stub, tmp_path):
+    stub.files['/f.txt'] = (b'first version\n', '"v1"')
+    cache = HTTP_Cache(tmp_path, max_age=0)
+    assert cache.get(f'{stub.base}/f.txt') == b'first version\n'
+    entry = cache._path(f'{stub.base}/f.txt')
+    with open(entry, 'rb') as f:
+        stored = f.read()
+
+    assert cache.get(f'{stub.base}/f.txt') == b'first version\n'
+    assert [status for _, status in stub.log] == [200, 304]
+    assert (cache.downloads, cache.revalidated) == (1, 1)
+    with open(entry, 'rb') as f:
+        assert f.read() == stored
+
+
+def test_changed_etag_downloads_the_new_version(stub, tmp_path):
+    stub.files['/f.txt'] = (b'first version\n', '"v1"')
+    cache = HTTP_Cache(tmp_path, max_age=0)
+    url = f'{stub.base}/f.txt'
+    cache.get(url)
+    assert cache.validator(url) == '"v1"'
+
+    stub.files['/f.txt'] = (b'second version\n', '"v2"')
+    assert cache.get(url) == b'second version\n'
+    assert cache.validator(url) == '"v2"'
+    assert cache.downloads == 2
+
+
+def test_recent_entry_is_not_revalidated(stub, tmp_path):
+    stub.files['/f.txt'] = (b'first version\n', '"v1"')
+    cache = HTTP_Cache(tmp_path, max_age=60)
+    cache.get(f'{stub.base}/f.txt')
+    stub.files['/f.txt'] = (b'second version\n', '"v2"')
+    assert cache.get(f'{stub.base}/f.txt') == b'first version\n'
+    assert len(stub.log) == 1 and cache.hits == 1
+
+
+def test_header_names_are_case_insensitive(stub, tmp_path):
+    stub.etag_header = 'etag'
+    stub.files['/f.txt'] = (b'first version\n', '"v1"')
+    pool = Connection_Pool()
+    cache = HTTP_Cache(tmp_path, max_age=0, pool=pool)
+    cache.get(f'{stub.base}/f.txt')
+    assert cache.validator(f'{stub.base}/f.txt') == '"v1"'
+    cache.get(f'{stub.base}/f.txt')
+    assert cache.revalidated == 1
+    pool.close()
+
+
+def test_evict_counts_the_subdirectories(tmp_path):
+    cache = HTTP_Cache(tmp_path, max_bytes=250)
+    files = {}
+    for age, name in enumerate(['results/a.parquet', 'rows/b.parquet', 'rows/b.json',
+                                'models/F11_cats.json', 'c.cache', 'results/d.parquet']):
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'x' * 100)
+        # oldest first
+        os.utime(path, (1000 + age, 1000 + age))
+        files[name] = path
+    (tmp_path / 'results' / 'e.tmp').write_bytes(b'x' * 100)
+    assert cache.size() == 600
+
+    cache.evict()
+    kept = sorted(name for name, path in files.items() if path.exists())
+    assert kept == ['c.cache', 'results/d.parquet']
+    assert (tmp_path / 'results' / 'e.tmp').exists()
+    assert (tmp_path / '.lock').exists()
+
+
+def test_loader_results_count_toward_the_cache_size(stub_base, tmp_path):
+    pytest.importorskip('pyarrow')
+    from halocarbons_loader import HATS_Loader
+    from test_results_cache import PATH, combined_file
+
+    stub_base.files[PATH] = (combined_file(250), '"v1"')
+    hats = HATS_Loader(cache_dir=tmp_path)
+    try:
+        hats.loader('F11', 'combined', verbose=False)
+        size = hats.cache.size()
+        assert size > os.path.getsize(hats.cache._path(f'{stub_base.base}{PATH}'))
+        # room for the download and one result, the older subset is evicted
+        hats.cache.max_bytes = size
+        hats.loader('F11', 'combined', verbose=False, start='1995')
+    finally:
+        hats.close()
+    assert hats.cache.size() <= size
+    assert len(os.listdir(tmp_path / 'results')) == 1
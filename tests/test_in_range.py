@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from halocarbons_loader import in_range
+
+
+@pytest.fixture
+def hourly():
+    dates = pd.date_range('2010-12-30', '2013-01-02 23:00', freq='h')
+    index = pd.MultiIndex.from_product([['brw', 'mlo'], dates], names=['site', 'date'])
+    return pd.DataFrame({'mf': np.arange(len(index), dtype=float)}, index=index)
+
+
+def test_end_date_includes_the_whole_day(hourly):
+    df = in_range(hourly, '2012-12-31', '2012-12-31')
+    dates = df.index.get_level_values('date')
+    assert len(df) == 2 * 24
+    assert dates.min() == pd.Timestamp('2012-12-31 00:00')
+    assert dates.max() == pd.Timestamp('2012-12-31 23:00')
+
+
+def test_end_year_includes_the_whole_year(hourly):
+    df = in_range(hourly, end='2011')
+    assert df.index.get_level_values('date').max() == pd.Timestamp('2011-12-31 23:00')
+
+
+def test_end_month(hourly):
+    df = in_range(hourly, start='2012-02', end='2012-02')
+    assert len(df) == 2 * 29 * 24
+
+
+def test_end_timestamp_is_exact(hourly):
+    df = in_range(hourly, end=pd.Timestamp('2012-12-31'))
+    assert df.index.get_level_values('date').max() == pd.Timestamp('2012-12-31 00:00')
+
+
+def test_date_column():
+    df = pd.DataFrame({'date': pd.date_range('2012-12-31', periods=48, freq='h'), 'mf': 1.0})
+    assert len(in_range(df, end='2012-12-31')) == 24
+    assert in_range(df) is df
+
+
+def test_cached_loads_of_different_end_periods(stub_base, tmp_path):
+    pytest.importorskip('pyarrow')
+    from halocarbons_loader import HATS_Loader
+    from test_results_cache import PATH, combined_file
+
+    stub_base.files[PATH] = (combined_file(250), '"v1"')
+    hats = HATS_Loader(cache_dir=tmp_path)
+    try:
+        day = hats.loader('F11', 'combined', verbose=False, start='1990-01', end='1995-01-01')
+        year = hats.loader('F11', 'combined', verbose=False, start='1990-01', end='1995')
+    finally:
+        hats.close()
+    assert len(day) == 61
+    assert len(year) == 72
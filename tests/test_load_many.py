@@ -0,0 +1,23 @@
+from halocarbons_loader import HATS_Loader
+
+from test_results_cache import PATH, combined_file
+
+
+def test_skipped_gases_are_recorded(stub_base, capsys):
+    stub_base.files[PATH] = (combined_file(250), '"v1"')
+    hats = HATS_Loader()
+    try:
+        results = hats.load_many(['cfc11', 'bogus', 'SF6'], programs=['combined', 'rits'], progress=False)
+    finally:
+        hats.close()
+
+    assert list(results) == [('F11', 'combined')]
+    assert hats.skipped == {
+        ('bogus', 'combined'): 'not measured by NOAA/GML',
+        ('bogus', 'rits'): 'not measured by NOAA/GML',
+        ('SF6', 'rits'): 'not measured by the rits program',
+    }
+    # F11 rits has no file on the stub server
+    assert ('F11', 'rits') in hats.errors
+    assert ('SF6', 'combined') in hats.errors
+    assert capsys.readouterr().out.count('does not measure bogus') == 1
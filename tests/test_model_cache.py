@@ -0,0 +1,81 @@
+import math
+
+import pandas as pd
+import pytest
+
+from gapfill import Gap_Methods
+from halocarbons_loader import HATS_Loader
+
+pytest.importorskip('pyarrow')
+
+SITES = ('brw', 'nwr', 'mlo', 'smo', 'spo', 'sum')
+
+
+def serve(stub, years=None):
+    """ CATS F11 monthly files, 2000 to 2005 or to years[site]. """
+    years = years or {}
+    for k, site in enumerate(SITES):
+        lines = ['# CATS F11 monthly', 'yyyy mm mf sd n']
+        lines += [f'{y} {m} {240 + k - (y - 2000) / 2 + 3 * math.sin(m / 2):.2f} 0.5 20'
+                  for y in range(2000, years.get(site, 2005) + 1) for m in range(1, 13)]
+        path = f'/cfcs/cfc11/insituGCs/CATS/monthly/{site}_F11_MM.dat'
+        stub.files[path] = (('\n'.join(lines) + '\n').encode(), f'"{len(lines)}"')
+
+
+@pytest.fixture
+def fits(monkeypatch):
+    """ (rows, warm) of every Holt-Winters parameter search. """
+    calls = []
+    hw_fit = Gap_Methods._hw_fit
+
+    def counted(self, Y, n, m, params, step):
+        calls.append((len(n), int((~pd.isna(params[0])).sum())))
+        return hw_fit(self, Y, n, m, params, step)
+
+    monkeypatch.setattr(Gap_Methods, '_hw_fit', counted)
+    return calls
+
+
+def load(hats):
+    # the gapfilled frame would come from the results cache otherwise
+    hats.results.clear()
+    return hats.loader('F11', 'cats', gapfill=True, addlocation=False, verbose=False)
+
+
+def test_models_are_reused_for_unchanged_sites(stub_base, tmp_path, fits):
+    serve(stub_base)
+    hats = HATS_Loader(cache_dir=tmp_path)
+    hats.cache.max_age = 0
+    try:
+        first = load(hats)
+        assert fits == [(6, 0)]
+        assert set(hats.models.get('F11', 'cats')) == set(SITES)
+
+        # same data, every site reuses its model
+        again = load(hats)
+        assert fits == [(6, 0)]
+        pd.testing.assert_frame_equal(again, first)
+
+        # a year appended to mlo, only mlo is refit and from its stored parameters
+        serve(stub_base, years={'mlo': 2006})
+        df = load(hats)
+        assert fits == [(6, 0), (1, 1)]
+        assert hats.models.get('F11', 'cats')['mlo']['n'] == 7 * 12
+        for site in set(SITES) - {'mlo'}:
+            pd.testing.assert_frame_equal(df.loc[site], first.loc[site])
+    finally:
+        hats.close()
+
+
+def test_models_are_refit_when_the_stored_series_changed(stub_base, tmp_path, fits):
+    serve(stub_base)
+    hats = HATS_Loader(cache_dir=tmp_path)
+    hats.cache.max_age = 0
+    try:
+        load(hats)
+        # spo is shorter now, its stored model does not fit the data any more
+        serve(stub_base, years={'spo': 2004})
+        load(hats)
+    finally:
+        hats.close()
+    assert fits == [(6, 0), (1, 0)]
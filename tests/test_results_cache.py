@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from halocarbons_loader import HATS_Loader
+
+PATH = '/cfcs/cfc11/combined/HATS_global_F11.txt'
+
+
+def combined_file(mf):
+    lines = ['# header', 'yyyy mm HATS_NH_F11 HATS_NH_F11_sd HATS_SH_F11 HATS_SH_F11_sd '
+             'HATS_Global_F11 HATS_Global_F11_sd Programs']
+    lines += [f'{y} {m} {mf} 0.2 {mf - 2} 0.2 {mf - 1} 0.2 101' for y in range(1990, 2000) for m in range(1, 13)]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def results(hats):
+    return [f for f in os.listdir(hats.results.cache_dir) if f.endswith('.parquet')]
+
+
+def test_changed_etag_invalidates_the_cached_result(stub_base, tmp_path):
+    stub_base.files[PATH] = (combined_file(250), '"v1"')
+    hats = HATS_Loader(cache_dir=tmp_path)
+    hats.cache.max_age = 0
+    try:
+        first = hats.loader('F11', 'combined', verbose=False)
+        assert (first['NH'] == 250).all()
+        assert len(results(hats)) == 1
+
+        # unchanged: revalidated with a 304 and read back from the cache
+        again = hats.loader('F11', 'combined', verbose=False)
+        assert stub_base.log[-1] == (PATH, 304)
+        assert (again['NH'] == 250).all()
+
+        stub_base.files[PATH] = (combined_file(260), '"v2"')
+        changed = hats.loader('F11', 'combined', verbose=False)
+        assert (changed['NH'] == 260).all()
+        # the result of the old version is replaced
+        assert len(results(hats)) == 1
+    finally:
+        hats.close()
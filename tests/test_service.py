@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from halocarbons_loader import HATS_Loader
+from halocarbons_service import HATS_Service, query
+
+from test_executor import SITES, serve_cats
+
+
+@pytest.fixture
+def service(stub_base):
+    serve_cats(stub_base)
+    service = HATS_Service(HATS_Loader())
+    srv = service.server(port=0)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    service.base = f'http://127.0.0.1:{srv.server_port}'
+    yield service
+    srv.shutdown()
+    srv.server_close()
+    service.hats.close()
+
+
+def get(service, path):
+    """ (status, decoded JSON or body) of a GET """
+    try:
+        with urllib.request.urlopen(f'{service.base}{path}', timeout=30) as r:
+            status, body = r.status, r.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    try:
+        return status, json.loads(body)
+    except ValueError:
+        return status, body
+
+
+def test_concurrent_requests_share_one_load(service, stub_base, monkeypatch):
+    calls = []
+    loader = service.hats.loader
+
+    def slow_loader(*args, **kwargs):
+        calls.append(args)
+        # the other requests arrive while the first one is loading
+        time.sleep(0.5)
+        return loader(*args, **kwargs)
+
+    monkeypatch.setattr(service.hats, 'loader', slow_loader)
+    results = [None] * 8
+
+    def request(i):
+        results[i] = query(service.base, 'F11', program='cats', sites=[SITES[i % len(SITES)]])
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len([path for path, _ in stub_base.log if path.endswith('_F11_MM.dat')]) == len(SITES)
+    stats = service.stats()
+    assert (stats['misses'], stats['waits'] + stats['hits']) == (1, 7)
+    assert all(len(df) == 60 for df in results)
+
+
+def test_status_codes(service):
+    status, body = get(service, '/data?gas=F11&program=cats&sites=BRW,Mlo')
+    assert status == 200
+    assert sorted(set(row[0] for row in body['data'])) == ['brw', 'mlo']
+
+    status, body = get(service, '/data?gas=F11&program=bogus')
+    assert status == 400 and 'program=bogus' in body['error']
+    status, body = get(service, '/data?gas=F11&program=cats&freq=weekly')
+    assert status == 400 and 'freq=weekly' in body['error']
+    status, body = get(service, '/data?gas=F11&program=cats&gapfill=spline')
+    assert status == 400 and 'gapfill=spline' in body['error']
+    assert get(service, '/data?gas=F11&format=xml')[0] == 400
+    assert get(service, '/data?program=cats')[0] == 400
+
+    status, body = get(service, '/data?gas=bogus&program=cats')
+    assert status == 404 and 'bogus' in body['error']
+    assert get(service, '/nothing')[0] == 404
+    assert get(service, '/stats')[0] == 200
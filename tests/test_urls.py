@@ -0,0 +1,60 @@
+import pytest
+
+import halocarbon_urls
+from halocarbon_urls import GAS_ALIASES, catalog
+
+from test_results_cache import PATH, combined_file
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    """ tmp_path as the data server, basehttp is restored afterwards. """
+    old = halocarbon_urls.basehttp
+    halocarbon_urls.set_basehttp(str(tmp_path))
+    yield tmp_path
+    halocarbon_urls.set_basehttp(old)
+
+
+@pytest.mark.parametrize('name, proper', [
+    ('F11', 'F11'), ('f11', 'F11'), ('cfc11', 'F11'), ('CFC11', 'F11'), ('11', 'F11'),
+    ('sf6', 'SF6'), ('mc', 'CH3CCl3'), ('ct', 'CCl4'), ('cos', 'OCS'),
+    ('134a', 'HFC134a'), ('134A', 'HFC134a'), ('1211', 'h1211'), ('H1211', 'h1211'), ('pce', 'C2Cl4'),
+])
+def test_aliases_resolve_to_the_proper_name(name, proper):
+    assert catalog().resolve(name) == proper
+
+
+def test_every_alias_names_a_measured_gas():
+    gases = set(catalog().gases)
+    assert set(GAS_ALIASES.values()) <= gases
+    assert all(catalog().resolve(alias) == proper for alias, proper in GAS_ALIASES.items())
+
+
+@pytest.mark.parametrize('name', ['bogus', 'F999', ''])
+def test_unknown_gas_resolves_to_none(name):
+    assert catalog().resolve(name) is None
+
+
+def test_set_basehttp_switches_later_urls_to_a_mirror(mirror):
+    base = mirror.as_uri()
+    assert halocarbon_urls.basehttp == base
+    assert catalog().base == base
+    assert all(url.startswith(f'{base}/') for url in catalog().all_urls())
+    assert halocarbon_urls.Flask_GCECD_URLs.BASE_URL == base
+    assert halocarbon_urls.insitu_URLs.file_urls('CATS', 'brw')['F11'] == \
+        f'{base}/cfcs/cfc11/insituGCs/CATS/monthly/brw_F11_MM.dat'
+    assert halocarbon_urls.HATS_MSD_URLs().urls['F11'].startswith(f'{base}/')
+
+
+def test_load_from_a_file_mirror(mirror):
+    from halocarbons_loader import HATS_Loader
+    path = mirror / PATH.lstrip('/')
+    path.parent.mkdir(parents=True)
+    path.write_bytes(combined_file(250))
+    hats = HATS_Loader()
+    try:
+        df = hats.loader('cfc11', 'combined', verbose=False)
+    finally:
+        hats.close()
+    assert len(df) == 120
+    assert df.attrs['gas'] == 'F11'